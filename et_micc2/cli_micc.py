@@ -5,7 +5,6 @@ Application micc2
 """
 import os
 from pathlib import Path
-import pkg_resources
 import shutil
 import subprocess
 import sys
@@ -29,20 +28,12 @@ def sys_path_helper():
 sys_path_helper()
 
 import et_micc2
-from et_micc2.tools.project import Project
 import et_micc2.tools.config as config
 import et_micc2.tools.messages as messages
+import et_micc2.tools.profiling as profiling
 
-from et_micc2.subcmds.add import add as add_cmd
-from et_micc2.subcmds.build import build as build_cmd
-from et_micc2.subcmds.check_env import check_env as check_cmd
-from et_micc2.subcmds.create import create as create_cmd
-from et_micc2.subcmds.doc import doc as doc_cmd
-from et_micc2.subcmds.info import info as info_cmd
-from et_micc2.subcmds.mv import mv as mv_cmd
-
-if '3.8' < sys.version:
-    from et_micc2.subcmds.check_env import check_env
+# The subcommand modules, et_micc2.tools.project and their (heavy) dependencies are imported
+# by the subcommands that need them, so that every micc2 command only pays for what it uses.
 
 __template_help = "Ordered list of Cookiecutter templates, or a single Cookiecutter template."
 
@@ -96,6 +87,20 @@ _preferences_setup = { "full_name":
     , help="If specified clears the project's ``et_micc2.log`` file."
     , default=False, is_flag=True
 )
+@click.option('--profile'
+    , help="Report the time spent in the phases of the command (config load, project detection, "
+           "TOML parse, template expansion, subprocess calls, git, serialization)."
+    , default=False, is_flag=True
+)
+@click.option('--profile-output'
+    , help="With --profile, also write a profile to this file: collapsed stacks (for flame graphs) "
+           "if the filename ends with .folded or .collapsed, cProfile statistics (for pstats) otherwise."
+    , default=''
+)
+@click.option('--timing-json'
+    , help="Append the durations of the logged steps of the command to this file, as JSON lines."
+    , default=''
+)
 # optionally overwrite preferences (supporting sub-commands only):
 @click.option('--full-name'
     , help=f"Overwrite preference `full_name`, use underscores for spaces. (supporting sub-commands only {_subcmds_supporting_overwrite_preferences})"
@@ -125,11 +130,16 @@ _preferences_setup = { "full_name":
     , help=f"Overwrite preference `minimal_python_version`. (supporting sub-commands only {_subcmds_supporting_overwrite_preferences})"
     , default=''
 )
+@click.option('--components-backend'
+    , help=f"Overwrite preference `components_backend`: `json` (default) or `sqlite`. (supporting sub-commands only {_subcmds_supporting_overwrite_preferences})"
+    , default=''
+)
 # end of preferences overwrite options
 # Don't put any options below, otherwise they will be treated as overwrite preferences.
 @click.version_option(version=et_micc2.__version__)
 @click.pass_context
 def main( ctx, verbosity, silent, project_path, clear_log
+        , profile, profile_output, timing_json
         , **overwrite_preferences
         ):
     """Micc2 command line interface.
@@ -147,6 +157,14 @@ def main( ctx, verbosity, silent, project_path, clear_log
     if verbosity > 1:
         print(f"micc2 ({et_micc2.__version__}) using Python", sys.version.replace('\n', ' '), end='\n\n')
 
+    if profile or profile_output:
+        profiler = profiling.Profiler(profile_output)
+        profiler.start()
+        def report_profile():
+            profiler.stop()
+            print(profiler.report(), file=sys.stderr)
+        ctx.call_on_close(report_profile)
+
     if clear_log:
         os.remove(project_path / 'micc.log')
 
@@ -156,6 +174,7 @@ def main( ctx, verbosity, silent, project_path, clear_log
         project_path=Path(project_path).resolve(),
         default_project_path=(project_path=='.'),
         clear_log=clear_log,
+        timing_json=timing_json,
         _cfg_filename=_cfg_filename,
         _cfg_dir=_cfg_dir,
         invoked_subcommand=ctx.invoked_subcommand
@@ -281,6 +300,10 @@ def setup( ctx
     selected["git_default_branch"] = "master" # default git branch
     selected["minimal_python_version"] = "3.7"  # default minimal Python version"
     selected["py"] = "py"
+    # The backend of the components database, 'json' or 'sqlite' (see INSTALLATION.rst):
+    selected["components_backend"] = context.overwrite_preferences.get(
+        'components_backend', context.preferences.data.get('components_backend', 'json') if modify else 'json'
+    )
 
     # Transfer the selected preferences to a Config object and save it to disk.
     context.preferences = config.Config(**selected)
@@ -324,7 +347,7 @@ def setup( ctx
     if sys.platform=='win32':
         if hasattr(os, 'enable_symlink') and not os.enable_symlink():
             raise WindowsError('Symlinking is disabled.')
-    src = Path(pkg_resources.get_distribution('et-micc2').location) / 'et_micc2/scripts'
+    src = Path(et_micc2.__file__).parent / 'scripts'
     dst = _cfg_dir / 'scripts'
     dst.unlink(missing_ok=True)
     os.symlink( src=src, dst=dst
@@ -401,6 +424,8 @@ def create( ctx
     If *project_path* is a subdirectory of a micc project, *micc* refuses to continu,
     unless ``--allow-nesting`` is soecified.
     """
+    from et_micc2.tools.project import Project
+    from et_micc2.subcmds.create import create as create_cmd
     context = ctx.obj
 
     if name:
@@ -474,6 +499,7 @@ def convert_to_package(ctx, overwrite, backup):
     project, which adds a ``AUTHORS.rst``, ``HISTORY.rst`` and ``installation.rst``
     to the documentation structure.
     """
+    from et_micc2.tools.project import Project
     context = ctx.obj
     context.overwrite = overwrite
     context.backup = backup
@@ -516,6 +542,8 @@ def info(ctx,name,version):
 
     Use verbosity to produce more detailed info.
     """
+    from et_micc2.tools.project import Project
+    from et_micc2.subcmds.info import info as info_cmd
     context = ctx.obj
 
     try:
@@ -572,6 +600,7 @@ def info(ctx,name,version):
 @click.pass_context
 def version(ctx, major, minor, patch, rule, tag, short, dry_run):
     """Modify or show the project's version number."""
+    from et_micc2.tools.project import Project
     context = ctx.obj
 
     if rule and (major or minor or patch):
@@ -611,6 +640,7 @@ def version(ctx, major, minor, patch, rule, tag, short, dry_run):
 @click.pass_context
 def tag(ctx):
     """Create a git tag and push it to the GitHub repo."""
+    from et_micc2.tools.project import Project
     context = ctx.obj
 
     try:
@@ -661,6 +691,11 @@ def tag(ctx):
     , help="Make backup files (.bak) before overwriting any pre-existing files."
     , default=False
 )
+@click.option('--dry-run', is_flag=True
+    , help="Expand the templates in memory and report the files that would be written, "
+           "without writing anything."
+    , default=False
+)
 @click.argument('name', type=str)
 @click.pass_context
 def add(ctx
@@ -673,6 +708,7 @@ def add(ctx
         # , templates
         , overwrite
         , backup
+        , dry_run
         ):
     """Add a component to the project
 
@@ -681,6 +717,8 @@ def add(ctx
     :param str name: name of the component. Maybe path-like relative to package directory to
         create sub-sub-modules.
     """
+    from et_micc2.tools.project import Project
+    from et_micc2.subcmds.add import add as add_cmd
     context = ctx.obj
     context.add_name = name
     
@@ -697,6 +735,7 @@ def add(ctx
     # TODO: remove overwrite and backup?
     context.overwrite = overwrite
     context.backup = backup
+    context.dry_run = dry_run
 
     try:
         project = Project(context)
@@ -734,6 +773,8 @@ def mv(ctx, component, to, msg, no_commit):
         to: New name for <component>, relative path of the component's new location, or ''
             to remove the component.
     """
+    from et_micc2.tools.project import Project
+    from et_micc2.subcmds.mv import mv as mv_cmd
     context = ctx.obj
 
     context.component = component
@@ -770,12 +811,34 @@ def mv(ctx, component, to, msg, no_commit):
     , help="Cleanup remove the build directory after a successful build."
     , default=False, is_flag=True
 )
+@click.option('-j', '--jobs'
+    , help="Number of parallel build jobs. Independent binary extensions are built in separate "
+           "processes, and the remaining jobs are passed on to make. Use 0 for the number of CPUs."
+    , default=1, type=int
+)
+@click.option('-G', '--generator'
+    , help="CMake generator: 'ninja', 'make', or 'auto' (default) to use ninja if it is available."
+    , default='auto', type=click.Choice(['auto', 'ninja', 'make'])
+)
+@click.option('--compiler-launcher'
+    , help="Compiler launcher, e.g. ccache or sccache, passed to CMake as CMAKE_<LANG>_COMPILER_LAUNCHER."
+    , default=''
+)
+@click.option('--lock-timeout'
+    , help="Maximum number of seconds to wait for another process building the same binary extension. "
+           "Waits forever by default."
+    , default=None, type=float
+)
 @click.pass_context
 def build( ctx
          , module
          , build_type
          , clean
          , cleanup
+         , jobs
+         , generator
+         , compiler_launcher
+         , lock_timeout
          ):
     """Build binary extensions.
 
@@ -791,10 +854,16 @@ def build( ctx
             print('')
             ctx.exit(ExitCodes.UserInterruptError)
 
+    from et_micc2.tools.project import Project
+    from et_micc2.subcmds.build import build as build_cmd
     context = ctx.obj
     context.build_options = SimpleNamespace( module_to_build = module
                                            , clean           = clean
                                            , cleanup         = cleanup
+                                           , jobs            = jobs
+                                           , generator       = generator
+                                           , compiler_launcher = compiler_launcher
+                                           , lock_timeout    = lock_timeout
                                            , cmake           = {}
                                            )
     if build_type:
@@ -816,8 +885,13 @@ def build( ctx
 #     , help="Overwrite existing setup."
 #     , default=False
 # )
+@click.option('--json', 'as_json', is_flag=True
+    , help="Print the results as JSON (for scripting)."
+    , default=False
+)
 @click.pass_context
 def check( ctx
+         , as_json
          ):
     """Check the completeness of the environment.
 
@@ -837,8 +911,12 @@ def check( ctx
     * git
     * gh
     * compilers
+
+    Tools are probed concurrently, and package versions are read from the package metadata.
     """
-    if '3.8' < sys.version:
+    ctx.obj.json = as_json
+    if sys.version_info >= (3, 8):
+        from et_micc2.subcmds.check_env import check_env as check_cmd
         check_cmd(ctx.obj)
     else:
         print("`micc2 check` requires python 3.8 or later.")
@@ -855,6 +933,8 @@ def doc(ctx, what):
 
     :param str what: this argument is passed to the make command.
     """
+    from et_micc2.tools.project import Project
+    from et_micc2.subcmds.doc import doc as doc_cmd
     context = ctx.obj
     context.what = what
     try:
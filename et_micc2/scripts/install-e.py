@@ -5,7 +5,11 @@ import subprocess
 from pathlib import Path
 import shutil
 import os
-import pkg_resources
+try:
+    import importlib.metadata as importlib_metadata
+except ImportError:
+    # Python < 3.8
+    import importlib_metadata
 
 
 def get_base_prefix_compat():
@@ -93,12 +97,12 @@ def main():
     print(f"> {' '.join(cmd)}")
     subprocess.check_call(cmd)
     try:
-        pkg_dist_info = pkg_resources.get_distribution(package_name)
-    except pkg_resources.DistributionNotFound:
+        pkg_dist_info = importlib_metadata.distribution(package_name)
+    except importlib_metadata.PackageNotFoundError:
         print(f'Package {package_name} not found.')
         raise
     else:
-        location = pkg_dist_info.location
+        location = pkg_dist_info.locate_file('')
         print(f'Package `{package_name}` installed at `{location}`.\n')
 
     # make installation editable
@@ -0,0 +1,540 @@
+import concurrent.futures
+from datetime import datetime
+import json
+from pathlib import Path
+import os
+import shutil
+from types import SimpleNamespace
+import sys
+import time
+
+import et_micc2
+
+import et_micc2.tools.buildcache as buildcache
+import et_micc2.tools.env as env
+import et_micc2.tools.messages as messages
+import et_micc2.tools.toolchain as toolchain
+import et_micc2.tools.utils as utils
+from et_micc2.subcmds.add import get_submodule_type
+from et_micc2.tools.filelock import FileLock, FileLockTimeout
+
+BUILD_REPORT = 'micc-build-report.json'
+
+
+def build(project):
+    """Build a binary extension.
+
+    A JSON build report, :file:`micc-build-report.json`, is written to the project directory
+    (see :py:func:`write_build_report`).
+    """
+    started = datetime.now()
+    start = time.perf_counter()
+
+    # get extension for binary extensions (depends on OS and python version)
+    extension_suffix = get_extension_suffix()
+
+    package_path = project.context.project_path / project.context.package_name
+
+    build_options = project.context.build_options
+    # Resolve the generator once for all binary extensions:
+    build_options.generator = resolve_generator(getattr(build_options, 'generator', 'auto'))
+    build_options.compiler_launcher = getattr(build_options, 'compiler_launcher', '')
+    if build_options.compiler_launcher and not env.which(build_options.compiler_launcher):
+        messages.warning(f"Compiler launcher `{build_options.compiler_launcher}` not found, building without it.")
+        build_options.compiler_launcher = ''
+    if build_options.module_to_build:
+        build_options.module_to_build = package_path / build_options.module_to_build
+
+    # Collect the binary extension modules to build
+    build_cache = buildcache.BuildCache(project.context.project_path)
+    contexts = []
+    up_to_date = []
+    reports = []
+    for root, dirs, files in os.walk(package_path):
+        for dir_ in dirs:
+            p_root = Path(root)
+            submodule_type = get_submodule_type(p_root / dir_)
+            # print(root, dir_, submodule_type)
+            if submodule_type in ('f90', 'cpp'):
+                build = True
+                if build_options.module_to_build:
+                    if build_options.module_to_build != p_root / dir_:
+                        build = False
+                if build:
+                    # Every binary extension gets its own copy of the build options, so that
+                    # the builds are independent and can be executed in separate processes.
+                    extension_options = SimpleNamespace(**vars(build_options))
+                    extension_options.submodule_srcdir_path = build_options.module_to_build \
+                        if build_options.module_to_build else (p_root / dir_)
+
+                    extension_options.submodule_path = extension_options.submodule_srcdir_path.parent
+                    extension_options.submodule_name = extension_options.submodule_srcdir_path.name
+                    extension_options.submodule_binary = extension_options.submodule_path / (
+                        extension_options.submodule_name + extension_suffix
+                    )
+                    extension_options.submodule_type = submodule_type
+
+                    # Skip binary extensions that were already built from the same sources and settings:
+                    extension_options.fingerprint = buildcache.fingerprint(extension_options)
+                    if not build_options.clean and build_cache.is_up_to_date(extension_options, extension_options.fingerprint):
+                        up_to_date.append(extension_options.submodule_binary)
+                        reports.append(extension_report(extension_options.submodule_binary, submodule_type, cache_hit=True))
+                        continue
+
+                    contexts.append(
+                        SimpleNamespace(project_path=project.context.project_path, build_options=extension_options)
+                    )
+
+    # Check the environment once for all binary extensions to build:
+    submodule_types = {context.build_options.submodule_type for context in contexts}
+    if 'f90' in submodule_types:
+        # Exit if f2py is not available
+        env.check_f2py(required=True)
+    if 'cpp' in submodule_types:
+        # Exit if cmake is not available:
+        env.check_cmake(required=True)
+        # exit if pybind11 is not available, and warn if too old...
+        env.check_pybind11(required=True)
+
+    # Distribute the available jobs over the binary extensions and the make processes
+    jobs = getattr(build_options, 'jobs', 1)
+    if jobs == 0:
+        jobs = os.cpu_count()
+    n_workers = max(1, min(jobs, len(contexts)))
+    for context in contexts:
+        context.build_options.parallel_level = max(1, jobs // n_workers)
+        context.build_options.console = n_workers == 1
+
+    if n_workers > 1:
+        make = cmake_generator(build_options.generator)[1]
+        project.logger.info(
+            f"Building {len(contexts)} binary extensions using {n_workers} processes "
+            f"({make} -j{contexts[0].build_options.parallel_level})."
+        )
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_build_worker, contexts))
+    else:
+        results = [_build_worker(context) for context in contexts]
+
+    # The builds are timed by the build loggers of the extensions, possibly in other processes:
+    for result in results:
+        project.logger.add_spans(result.spans)
+
+    succeeded = [result for result in results if not result.exit_code]
+    failed    = [result for result in results if result.exit_code]
+
+    reports.extend(result.report for result in results)
+    write_build_report(
+        project.context.project_path / BUILD_REPORT,
+        { 'micc2_version': et_micc2.__version__
+        , 'project'      : project.context.project_path.name
+        , 'python'       : sys.version.replace('\n', ' ')
+        , 'generator'    : build_options.generator
+        , 'jobs'         : jobs
+        , 'started'      : started.isoformat(timespec='seconds')
+        , 'duration'     : round(time.perf_counter() - start, 3)
+        , 'extensions'   : reports
+        }
+    )
+
+    if up_to_date:
+        project.logger.info("\n\nBinary extensions up to date (use --clean to force a rebuild):")
+        for binary_extension in up_to_date:
+            project.logger.info(f"  - {binary_extension}")
+
+    if succeeded:
+        project.logger.info("\n\nBinary extensions built successfully:")
+        for result in succeeded:
+            project.logger.info(f"  - {result.binary}")
+
+    if failed:
+        project.logger.error("\nBinary extensions failing to build:")
+        for result in failed:
+            project.logger.error(f"  - {result.binary} (exit code {result.exit_code}, see {result.log_file})")
+
+    if not succeeded and not failed and not up_to_date:
+        messages.warning(f"No binary extensions found in package ({project.context.package_name}).")
+
+
+def _build_worker(context):
+    """Build a single binary extension and report the outcome.
+
+    Only one process at a time can build a binary extension, as the build directory and the
+    log file are shared. Hence, the lock file :file:`micc-build.lock` in the extension's source
+    directory is acquired first. If another process was building the binary extension, and the
+    result is up to date, it is not built again.
+
+    This function is executed in a worker process when building binary extensions in parallel,
+    hence it must only depend on picklable arguments.
+
+    :return: SimpleNamespace(binary, log_file, exit_code, report, spans), with spans the
+        blocks timed while building (see :py:meth:`messages.IndentingLogger.add_spans`).
+    """
+    build_options = context.build_options
+    result = SimpleNamespace(
+        binary=build_options.submodule_binary,
+        log_file=build_options.submodule_srcdir_path / "micc-build.log",
+        exit_code=0,
+        report=extension_report(build_options.submodule_binary, submodule_type=build_options.submodule_type),
+        spans=[],
+    )
+    lock = FileLock(
+        build_options.submodule_srcdir_path / 'micc-build.lock',
+        timeout=getattr(build_options, 'lock_timeout', None)
+    )
+    try:
+        lock.acquire()
+    except FileLockTimeout as exc:
+        messages.warning(f"{exc}\nAnother process is building {build_options.submodule_binary}.")
+        result.exit_code = result.report['exit_code'] = 1
+        return result
+
+    try:
+        build_cache = buildcache.BuildCache(context.project_path)
+        if not build_options.clean and build_cache.is_up_to_date(build_options, build_options.fingerprint):
+            # built by another process while we were waiting for the lock.
+            result.report.update(extension_report(build_options.submodule_binary, build_options.submodule_type, cache_hit=True))
+            return result
+        try:
+            result.exit_code = build_binary_extension(context, report=result.report)
+        except RuntimeError as exc:
+            if build_options.console:
+                raise
+            result.exit_code = getattr(exc, 'exit_code', 1) or 1
+        result.spans = getattr(context, 'spans', [])
+        result.report['exit_code'] = result.exit_code
+        if result.exit_code:
+            result.report['status'] = 'failed'
+        # Update the build cache:
+        build_cache.store(
+            build_options, None if result.exit_code else build_options.fingerprint,
+            getattr(context, 'dependencies', None)
+        )
+    finally:
+        lock.release()
+    return result
+
+
+def build_binary_extension(context, report=None):
+    """Build a binary extension described by *context*.
+
+    The build output is written to :file:`micc-build.log` in the extension's source directory,
+    and also to the console, unless ``context.build_options.console`` is False.
+
+    :param context: SimpleNamespace with the project path and the build options of the binary extension.
+        After a successful build, the dependencies of the binary extension are stored in
+        ``context.dependencies`` (see :py:func:`buildcache.dependencies`). The blocks timed
+        while building are stored in ``context.spans``.
+    :param dict report: if not None, the durations of the build steps, the compiler settings and
+        the binary size are recorded in it (see :py:func:`extension_report`).
+    :return: exit code of the build.
+    """
+    build_options = context.build_options
+    if report is None:
+        report = extension_report(build_options.submodule_binary, submodule_type=build_options.submodule_type)
+
+    # The binary extension is not removed before the build. It is installed in a staging
+    # directory first, and replaces the previous binary only if the build succeeds, so that
+    # the package remains importable during (and after a failing) build.
+    module_to_build = build_options.submodule_srcdir_path.relative_to(context.project_path)
+    build_log_file = build_options.submodule_srcdir_path / "micc-build.log"
+    build_logger = messages.create_logger(
+        build_log_file, filemode='w', use_logfile=True, console=getattr(build_options, 'console', True)
+    )
+    try:
+        with messages.log(build_logger.info, f"Building {build_options.submodule_type} module '{module_to_build}':"):
+            destination = build_options.submodule_binary
+
+            if build_options.submodule_type in ('cpp', 'f90') and (build_options.submodule_srcdir_path / 'CMakeLists.txt').is_file():
+                output_dir = build_options.submodule_srcdir_path / '_cmake_build'
+                # build_dir = output_dir
+                if build_options.clean and output_dir.exists():
+                    build_logger.info(f"--clean: shutil.removing('{output_dir}').")
+                    shutil.rmtree(output_dir)
+                output_dir.mkdir(parents=True, exist_ok=True)
+                staging_dir = output_dir / '_staging'
+                if staging_dir.exists():
+                    shutil.rmtree(staging_dir)
+
+                # CMake refuses to reuse a build directory that was configured with another generator:
+                generator, make = cmake_generator(build_options.generator)
+                cmake_cache = read_cmake_cache(output_dir)
+                configured_generator = cmake_cache.get('CMAKE_GENERATOR', generator)
+                if configured_generator != generator:
+                    build_logger.info(f"Build directory was configured for `{configured_generator}`, removing '{output_dir}'.")
+                    shutil.rmtree(output_dir)
+                    output_dir.mkdir(parents=True, exist_ok=True)
+                    cmake_cache = {}
+
+                with utils.in_directory(output_dir):
+                    # CAVEAT: using sys.executable implies that we automatically build against the python version used
+                    #         by micc2. This is not always what we want.
+                    defines = {'PYTHON_EXECUTABLE': sys.executable}
+                    defines.update(context.build_options.cmake)
+
+                    if build_options.compiler_launcher:
+                        # e.g. ccache or sccache. Note that f2py does not use the Fortran compiler launcher.
+                        lang = 'CXX' if build_options.submodule_type == 'cpp' else 'Fortran'
+                        for lang_ in ('C', lang):
+                            defines[f"CMAKE_{lang_}_COMPILER_LAUNCHER"] = build_options.compiler_launcher
+
+                    if build_options.submodule_type== 'cpp':
+                        defines['pybind11_DIR'] = path_to_cmake_tools()
+
+                    cmake_cmd = ['cmake', '-G', generator]
+                    for key,val in defines.items():
+                        cmake_cmd.extend(['-D', f"{key}={val}"])
+                    cmake_cmd.append('..')
+
+                    parallel_level = getattr(build_options, 'parallel_level', 1)
+                    if make == 'ninja':
+                        # ninja is parallel by default, so the parallel level is always specified.
+                        make_cmd = [make, f'-j{parallel_level}', '-v']
+                    elif make == 'nmake':
+                        make_cmd = [make, 'VERBOSE=1'] # nmake does not support parallel builds
+                    else:
+                        make_cmd = [make, f'-j{parallel_level}', 'VERBOSE=1'] if parallel_level > 1 else [make, 'VERBOSE=1']
+
+                    # The build step reruns the configure step by itself if CMakeLists.txt was modified,
+                    # so we only configure if the build directory is not yet configured with the same
+                    # settings.
+                    report['reused_configuration'] = is_configured(output_dir, cmake_cache, generator, defines)
+                    if report['reused_configuration']:
+                        build_logger.info(f"Reusing configured build directory '{output_dir}'.")
+                        exit_code = 0
+                    else:
+                        start = time.perf_counter()
+                        exit_code = utils.execute(
+                            cmake_cmd, build_logger.debug, stop_on_error=True, env=os.environ.copy()
+                        )
+                        report['durations']['configure'] = round(time.perf_counter() - start, 3)
+
+                    if not exit_code:
+                        ninja_log = output_dir / '.ninja_log'
+                        ninja_log_size = ninja_log.stat().st_size if ninja_log.exists() else 0
+                        start = time.perf_counter()
+                        exit_code = utils.execute(
+                            make_cmd, build_logger.debug, stop_on_error=True, env=os.environ.copy()
+                        )
+                        report['durations']['build'] = round(time.perf_counter() - start, 3)
+                        if make == 'ninja':
+                            report['durations'].update(ninja_step_durations(ninja_log, ninja_log_size))
+
+                    # This is a fix for the native Windows case, when using the
+                    # Intel Python distribution and building a f90 binary extension
+                    fix = sys.platform == 'win32' and 'intel' in sys.executable and build_options.submodule_type == 'f90'
+                    if fix:
+                        from glob import glob
+                        search = str(build_options.submodule_srcdir_path / '_cmake_build' / f'{build_options.submodule_name}.*.pyd')
+                        # print(search)
+                        pyd = glob(search)
+                        destination = build_options.submodule_binary.parent / f'{build_options.submodule_name}.pyd'
+                        staged = Path(pyd[0]) if pyd else None
+                    elif not exit_code:
+                        # Install with DESTDIR, which is prepended to the install destination
+                        # in CMakeLists.txt, i.e. the package directory.
+                        start = time.perf_counter()
+                        exit_code = utils.execute(
+                            [make, 'install'], build_logger.debug, stop_on_error=True,
+                            env=dict(os.environ, DESTDIR=str(staging_dir))
+                        )
+                        report['durations']['install'] = round(time.perf_counter() - start, 3)
+                        staged = next(staging_dir.rglob(destination.name), None) if staging_dir.exists() else None
+
+                    if not exit_code:
+                        if staged is None:
+                            build_logger.error(f"Binary extension `{destination.name}` not found after the build.")
+                            exit_code = 1
+                        else:
+                            build_logger.info(f'Installing `{staged}` as {destination}')
+                            install_binary(staged, destination)
+                    else:
+                        if destination.exists():
+                            build_logger.warning(f"Build failed, keeping the previous binary extension {destination}.")
+
+                    if staging_dir.exists():
+                        shutil.rmtree(staging_dir)
+
+                    report['compiler'] = compiler_settings(
+                        read_cmake_cache(output_dir), 'CXX' if build_options.submodule_type == 'cpp' else 'Fortran'
+                    )
+                    report['exit_code'] = exit_code
+                    report['status'] = 'failed' if exit_code else 'built'
+                    if not exit_code:
+                        report['binary_size'] = destination.stat().st_size
+                        # Read the dependencies for the build cache before --cleanup removes the build tree:
+                        context.dependencies = buildcache.dependencies(build_options)
+
+                    if build_options.cleanup:
+                        build_logger.info(f"--cleanup: shutil.removing('{output_dir}').")
+                        shutil.rmtree(output_dir)
+            else:
+                raise RuntimeError("Bad submodule type, or no CMakeLists.txt")
+
+    finally:
+        messages.close_logger(build_logger)
+        context.spans = build_logger.spans
+    return exit_code
+
+
+def extension_report(binary: Path, submodule_type: str = '', cache_hit: bool = False) -> dict:
+    """Return the build report entry of a binary extension, with the fields that are known
+    before it is built. If *cache_hit* is True, the binary extension is up to date.
+    """
+    binary = Path(binary)
+    return { 'name'                : binary.name.split('.')[0]
+           , 'binary'              : str(binary)
+           , 'type'                : submodule_type
+           , 'status'              : 'up-to-date' if cache_hit else 'failed'
+           , 'cache_hit'           : cache_hit
+           , 'exit_code'           : 0 if cache_hit else None
+           , 'reused_configuration': None
+           , 'durations'           : {}
+           , 'compiler'            : {}
+           , 'binary_size'         : binary.stat().st_size if cache_hit and binary.exists() else None
+           }
+
+
+def ninja_step_durations(ninja_log: Path, offset: int = 0) -> dict:
+    """Return the total duration (s) of the compile and link steps in :file:`.ninja_log`.
+
+    Only the entries appended after byte *offset*, i.e. by the last build, are considered.
+    Entries are lines ``start_ms end_ms mtime output hash``. Outputs ending in ``.o`` or ``.obj``
+    are compile steps, the other outputs are link steps.
+    """
+    durations = {'compile': 0.0, 'link': 0.0}
+    try:
+        with ninja_log.open() as f:
+            f.seek(offset)
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.split('\t')
+                if len(fields) < 4:
+                    continue
+                step = 'compile' if fields[3].endswith(('.o', '.obj')) else 'link'
+                durations[step] += (int(fields[1]) - int(fields[0])) / 1000
+    except (OSError, ValueError):
+        return {}
+    return {step: round(duration, 3) for step, duration in durations.items()}
+
+
+def compiler_settings(cmake_cache: dict, lang: str) -> dict:
+    """Return the compiler and compiler flags for language *lang* ('CXX' or 'Fortran') from the
+    entries of :file:`CMakeCache.txt`.
+    """
+    build_type = cmake_cache.get('CMAKE_BUILD_TYPE', '')
+    settings = { 'compiler'  : cmake_cache.get(f'CMAKE_{lang}_COMPILER', '')
+               , 'launcher'  : cmake_cache.get(f'CMAKE_{lang}_COMPILER_LAUNCHER', '')
+               , 'build_type': build_type
+               , 'flags'     : cmake_cache.get(f'CMAKE_{lang}_FLAGS', '')
+               }
+    if build_type:
+        settings['build_type_flags'] = cmake_cache.get(f'CMAKE_{lang}_FLAGS_{build_type.upper()}', '')
+    return settings
+
+
+def write_build_report(path: Path, report: dict):
+    """Write the build report *report* to file *path* as JSON (atomically)."""
+    with utils.atomic_replace(path) as tmp:
+        with tmp.open('w') as f:
+            json.dump(report, f, indent=2)
+
+
+def resolve_generator(generator: str = 'auto') -> str:
+    """Return 'ninja' if *generator* is 'auto' and ninja is available, 'make' if it is not,
+    and *generator* otherwise.
+    """
+    if generator == 'auto':
+        generator = 'ninja' if env.which('ninja') else 'make'
+    return generator
+
+
+def cmake_generator(generator: str = 'auto'):
+    """Select a CMake generator and the corresponding build tool.
+
+    Params:
+        generator: 'ninja', 'make', or 'auto' to select 'ninja' if it is available, and 'make' otherwise.
+
+    Returns:
+        tuple (CMake generator name, build tool executable)
+    """
+    if resolve_generator(generator) == 'ninja':
+        return 'Ninja', 'ninja'
+    if sys.platform == 'win32':
+        return 'NMake Makefiles', 'nmake'
+    return 'Unix Makefiles', 'make'
+
+
+def read_cmake_cache(build_dir: Path) -> dict:
+    """Read the entries of :file:`CMakeCache.txt` in *build_dir* as a dict.
+
+    Entries have the form ``KEY:TYPE=VALUE``. Returns an empty dict if the build directory
+    has not been configured.
+    """
+    entries = {}
+    try:
+        with (Path(build_dir) / 'CMakeCache.txt').open() as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith(('#', '//')) or not '=' in line:
+                    continue
+                key_type, value = line.split('=', 1)
+                entries[key_type.split(':', 1)[0]] = value
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def is_configured(build_dir: Path, cmake_cache: dict, generator: str, defines: dict) -> bool:
+    """Is *build_dir* configured with *generator*, for the source directory that contains it
+    (its parent), and with the same values for the CMake variables in *defines*?
+
+    Params:
+        build_dir: CMake build directory
+        cmake_cache: the entries of :file:`CMakeCache.txt` in *build_dir*, as returned by :py:func:`read_cmake_cache`.
+        generator: CMake generator
+        defines: CMake variables passed on the command line, as {variable: value}.
+    """
+    if not cmake_cache:
+        return False
+    # The build system must have been generated by a successful configure step:
+    build_file = 'build.ninja' if generator == 'Ninja' else 'Makefile'
+    if not (build_dir / build_file).is_file():
+        return False
+    if cmake_cache.get('CMAKE_GENERATOR') != generator:
+        return False
+    home_directory = cmake_cache.get('CMAKE_HOME_DIRECTORY')
+    if not home_directory or Path(home_directory).resolve() != build_dir.parent.resolve():
+        return False
+    for key, val in defines.items():
+        if cmake_cache.get(key) != str(val):
+            return False
+    return True
+
+
+def install_binary(staged: Path, destination: Path):
+    """Replace *destination* with a copy of *staged*.
+
+    The copy is written next to *destination* and then renamed, which is atomic. Processes
+    importing the binary extension concurrently see either the previous or the new binary,
+    and processes that already loaded the previous binary keep using it.
+    """
+    with utils.atomic_replace(destination) as tmp:
+        shutil.copy2(staged, tmp)
+
+
+def path_to_cmake_tools():
+    """Return the path to the folder with the CMake tools of pybind11.
+
+    The location is taken from the cached toolchain discovery, see :py:mod:`et_micc2.tools.toolchain`.
+    """
+    p = toolchain.get_toolchain()['pybind11_cmake_dir']
+    if not p:
+        raise ModuleNotFoundError(f'pybind11 not found in {toolchain.site_packages()}')
+    return p
+
+
+def get_extension_suffix():
+    """Return the extension suffix, e.g. :file:`.cpython-37m-darwin.so`."""
+    return toolchain.get_toolchain()['ext_suffix']
@@ -35,7 +35,8 @@ def add(project):
         submodule = Submodule(project)
         db_entry = submodule.create()
 
-    project.serialize(db_entry)
+    if not getattr(project.context, 'dry_run', False):
+        project.serialize(db_entry)
 
 class Submodule:
     def __init__(self, project):
@@ -129,6 +130,8 @@ class Submodule:
             if msg:
                 self.logger.critical(msg)
                 return
+            if getattr(self.context, 'dry_run', False):
+                return
 
             src_file = self.context.project_path / self.context.package_name / self.context.add_name / '__init__.py'
             tst_file = self.context.project_path / 'tests' / self.context.package_name / self.context.add_name / f'test_{self.context.module_name}.py'
@@ -160,6 +163,8 @@ class Submodule:
             if msg:
                 self.logger.critical(msg)
                 return
+            if getattr(self.context, 'dry_run', False):
+                return
 
             src_file = self.context.project_path / self.context.package_name / self.context.add_name / (self.context.module_name+'.f90')
             cmk_file = self.context.project_path / self.context.package_name / self.context.add_name / 'CMakeLists.txt'
@@ -188,7 +193,7 @@ class Submodule:
         import_lib = self.context.import_lib
         text_to_insert = [
             f"",
-            f"from et_micc2.subcmds.build import build_missing",
+            f"from et_micc2.tools.autobuild import build_missing",
             f"build_missing(__file__, '{module_name}')",
             f"import {import_lib}",
         ]
@@ -211,6 +216,8 @@ class Submodule:
             if msg:
                 self.logger.critical(msg)
                 return
+            if getattr(self.context, 'dry_run', False):
+                return
 
             src_file = self.context.project_path /           self.context.package_name / self.context.add_name / (self.context.module_name+'.cpp')
             cmk_file = self.context.project_path /           self.context.package_name / self.context.add_name / 'CMakeLists.txt'
@@ -310,6 +317,8 @@ class Cli:
             if msg:
                 self.context.logger.critical(msg)
                 return
+            if getattr(self.context, 'dry_run', False):
+                return
 
             package_name = self.context.template_parameters['package_name']
             src_file = os.path.join(self.context.project_path.name, package_name, 'cli', f"{app_name}.py")
@@ -6,64 +6,144 @@ Module et_micc2.check_environment
 This submodule implements the ``micc check`` command.
 
 It checks the environment for Python packages and tools micc2 depends on.
+
+The tools are probed concurrently, and the versions of the Python packages are read from
+their metadata, rather than by importing them, so that the check is fast, even on file
+systems with a high latency.
 """
 
+import json
 import os,sys
-import subprocess
-import importlib
-from importlib.metadata import version
 import click
+import semantic_version
+
+import et_micc2.tools.env as env
+import et_micc2.tools.toolchain as toolchain
+
+# Python packages and their minimal versions
+modules = {'numpy'              : '1.17.0'
+          ,'pybind11'           : '2.6.2'
+          ,'sphinx'             : '3.4'
+          ,'sphinx_rtd_theme'   : '0.5'
+          ,'sphinx_click'       : '2.7'
+          ,'click'              : '7.0'
+          ,'pytest'             : '5.0'
+          }
+
+# Tools, in the order in which they are reported
+tools = ('python', 'poetry', 'git', 'gh', 'cmake', 'make', 'g++', 'icpc', 'gcc', 'gfortran', 'ifort')
 
-def check_tool(tool,local,not_required_message=None):
+
+def check_package(module_name, version_needed):
+    """Check the availability of a Python package, without importing it.
+
+    :param str module_name: name of the Python package, e.g. 'numpy'
+    :param str version_needed: minimal version of the package
+    :return: dict with keys 'version', 'required', 'location' and 'ok'.
     """
+    result = {'version': '', 'required': version_needed, 'location': '', 'ok': False}
+    distribution = env.get_distribution(module_name)
+    if distribution is None:
+        return result
+    result['version'] = distribution.version
+    result['location'] = str(distribution.locate_file(''))
+    try:
+        result['ok'] = semantic_version.Version.coerce(distribution.version) \
+                    >= semantic_version.Version.coerce(version_needed)
+    except ValueError:
+        result['ok'] = True # cannot compare, give the benefit of the doubt
+    return result
+
+
+def check_tool(tool, local):
+    """Check the availability of a tool.
+
     :param str tool: name of executable, e.g. 'cmake'
+    :param bool local: True if not running on a VSC cluster.
+    :return: dict with keys 'which', 'version', 'system' and 'ok'. On a VSC cluster, tools
+        installed as part of the operating system are not ok.
+    """
+    which = env.which(tool) or ''
+    result = {'which': which, 'version': '', 'system': False, 'ok': bool(which)}
+    if which:
+        result['version'] = env.tool_version(tool)
+        if not local and env.is_os_tool(which):
+            result['system'] = True
+            result['ok'] = False
+    return result
+
+
+def probe(local):
+    """Probe the Python packages and the tools concurrently.
+
+    :return: dict with keys 'python', 'packages' and 'tools'.
     """
-    completed_which = subprocess.run(['which', tool], capture_output=True, text=True)
-    which_string = completed_which.stdout.strip().replace('\n', ' ')
-    if completed_which.returncode !=0:
+    env.probe_tools(tools)
+    return { 'python'  : { 'which': env.which('python') or ''
+                         , 'executable': sys.executable
+                         , 'version': sys.version.replace('\n', ' ')
+                         }
+           , 'packages': {module_name: check_package(module_name, version_needed)
+                          for module_name, version_needed in modules.items()}
+           , 'tools'   : {tool: check_tool(tool, local) for tool in tools}
+           }
+
+
+def print_tool(tool, info, not_required_message=None):
+    """Print the result of :py:func:`check_tool`."""
+    version_string = info['version'].replace('\n','\n        ')
+    if not info['which']:
         click.secho(f'    {tool} is not available.', fg='bright_red')
         if not_required_message:
-            print(f'      {not_required_message}') 
-        return False
+            print(f'      {not_required_message}')
+    elif info['system']:
+        click.secho(f'   {tool} is available from the system. However, it is recommended to use a cluster module version.'
+                   , fg='bright_red'
+                   )
+        print(      f'     {info["which"]}\n'
+                    f'     {version_string}\n')
     else:
-        completed_version = subprocess.run([tool, '--version'], capture_output=True, text=True)
-        version_string = completed_version.stdout.strip().replace('\n\n','\n').replace('\n','\n        ')
-        if local:
-            click.secho(f'    {tool} is available:', fg='green')
-            print(f'      {version_string}')
-            print(f'      {which_string}')
-            return True
-        else: # VSC cluster
-            
-            if completed_which.stdout.startswith('/usr/bin/'):                
-                click.secho(f'   {tool} is available from the system. However, it is recommended to use a cluster module version.'
-                           , fg='bright_red'
-                           )
-                print(      f'     {which_string}\n'
-                            f'     {version_string}\n')
-                return False
-            else:
-                click.secho(f'    {tool} is available:', fg='green')
-                print(f'      {version_string}')
-                print(f'      {which_string}')
-                return True
+        click.secho(f'    {tool} is available:', fg='green')
+        print(f'      {version_string}')
+        print(f'      {info["which"]}')
+    return info['ok']
 
 
 def check_env(options):
+    """Check the environment, and print a human readable report, or, if ``options.json``
+    is set, a JSON report.
     """
-    """
-    
     where = os.environ['VSC_INSTITUTE_CLUSTER'] if 'VSC_HOME' in os.environ else 'local'
     local = where=='local'
 
+    report = probe(local)
+    packages = report['packages']
+    tools_ = report['tools']
+
+    found = {module_name: bool(info['version']) for module_name, info in packages.items()}
+    ready = { 'poetry'   : tools_['poetry']['ok']
+            , 'pytest'   : found['pytest']
+            , 'build_cpp': found['pybind11'] and tools_['cmake']['ok']
+            , 'build_f90': found['numpy'] and tools_['cmake']['ok']
+            , 'cli'      : found['click']
+            , 'doc'      : found['sphinx'] and found['sphinx_rtd_theme'] and found['sphinx_click']
+            , 'git'      : tools_['git']['ok']
+            , 'gh'       : tools_['gh']['ok']
+            }
+    report['where'] = where
+    report['ready'] = ready
+
+    if getattr(options, 'json', False):
+        if options.verbosity > 1:
+            report['toolchain'] = toolchain.get_toolchain()
+        print(json.dumps(report, indent=2))
+        return
+
     print('Python\n'
           '------')
-    completed_which = subprocess.run(['which', 'python'],text=True,capture_output=True)
-    which_string = completed_which.stdout.replace('\n', '')
-
+    which_string = report['python']['which']
     print(f'python = {which_string}')
-    python_version = sys.version.replace('\n', ' ')
-    print(f'version= {python_version}')
+    print(f'version= {report["python"]["version"]}')
     if not local:
         # check that we are not using the system Python:
         if '/usr/bin/' in which_string:
@@ -76,48 +156,28 @@ def check_env(options):
     pip_install_cluster = '    To install it, run `python -m pip install --user {module_name}`'
     load_module = '    Load a cluster module containing {module_name}.'
 
-    can_build_doc = True
-    can_build_cpp = True
-    can_build_f90 = True
-    can_build_cli = True
-    can_pytest    = True
-    can_poetry    = True
-    can_git       = True
-    can_gh        = True
-
-    modules = {'numpy'              : '1.17.0'
-              ,'pybind11'           : '2.6.2'
-              ,'sphinx'             : '3.4'
-              ,'sphinx_rtd_theme'   : '0.5'
-              ,'sphinx_click'       : '2.7'
-              ,'click'              : '7.0'
-              ,'pytest'             : '5.0'
-              }
     print('\nPython packages'
           '\n---------------')
-    for module_name, version_needed in modules.items():
-        try:
-            m = importlib.import_module(module_name)
-            version = importlib.metadata.version(module_name)
-            if version < version_needed:
-                click.secho(f'\n{module_name}: FOUND {version}, but expecting {version_needed}', fg='bright_red')
+    for module_name, info in packages.items():
+        version_needed = info['required']
+        if info['version']:
+            if not info['ok']:
+                click.secho(f'\n{module_name}: FOUND {info["version"]}, but expecting {version_needed}', fg='bright_red')
             else:
-                print(f'\n{module_name}: {version} is OK (>={version_needed}).')
+                print(f'\n{module_name}: {info["version"]} is OK (>={version_needed}).')
                 if options.verbosity > 1:
-                    print(f'    {m}')
-        except ModuleNotFoundError:
+                    print(f'    {info["location"]}')
+        else:
             fg = 'bright_red'
-            click.secho(f'\n{module_name}: NOT FOUND, need {modules[module_name]} or later', fg=fg)
+            click.secho(f'\n{module_name}: NOT FOUND, need {version_needed} or later', fg=fg)
             s = None
             if module_name=='numpy':
                 print(f'    {module_name} is needed for building binary extensions from Fortran.')
                 s = pip_install if local else load_module
-                can_build_f90 = False
 
             elif module_name=='pybind11':
                 print(f'    {module_name} is needed for building binary extensions from C++.')
                 s = pip_install if local else pip_install_cluster
-                can_build_cpp = False
 
             elif module_name.startswith('sphinx'):
                 if local:
@@ -125,17 +185,14 @@ def check_env(options):
                     s = pip_install
                 else:
                     print('    It is discouraged to build documentation on the cluster. Please consider building documentation on a desktop.')
-                can_build_doc = False
 
             elif 'click' in module_name:
                 print('    Click is only needed for building CLIs.')
                 s = pip_install if local else pip_install_cluster
-                can_build_cli = False
 
             elif module_name=='pytest':
                 print(f'    {module_name} is needed for automating tests.')
                 s = pip_install if local else '\n'.join([pip_install_cluster, load_module])
-                can_pytest = False
 
             else:
                 print(f'    No recommandation for missing {module_name}.')
@@ -149,37 +206,35 @@ def check_env(options):
     # poetry
     print('\n- poetry:')
     not_required_message = 'The use of Poetry is discouraged on the cluster.' if not local else None
-    can_poetry = check_tool('poetry', local, not_required_message=not_required_message)
-        
+    print_tool('poetry', tools_['poetry'], not_required_message=not_required_message)
+
     # git
     print('\n- VCS:')
-    can_git = check_tool('git', local)
-    can_gh = check_tool('gh', local)
+    print_tool('git', tools_['git'])
+    print_tool('gh', tools_['gh'])
 
     # CMake
     print('\n- CMake:')
-    if not check_tool('cmake', local):
-        can_build_f90 = False
-        can_build_cpp = False
+    print_tool('cmake', tools_['cmake'])
+    print_tool('make', tools_['make'])
 
     # compilers
     print('\n- Compilers:')
-    check_tool('g++', local)
-    print()
-    check_tool('icpc', local)
-    print()
-    check_tool('gcc', local)
-    print()
-    check_tool('gfortran', local)
-    print()
-    check_tool('ifort', local)
+    for i, compiler in enumerate(('g++', 'icpc', 'gcc', 'gfortran', 'ifort')):
+        if i:
+            print()
+        print_tool(compiler, tools_[compiler])
 
     print('\nYour environment is ready to:')
-    print('  - use poetry (e.g. `poetry publish --build`):', 'YES' if can_poetry    else 'NO')
-    print('  - use pytest for automating tests           :', 'YES' if can_pytest    else 'NO')
-    print('  - build binary extensions from C++          :', 'if a C++ compiler is available' if can_build_cpp else 'NO')
-    print('  - build binary extensions from Fortra       :', 'if a Fortran and a C compiler are available' if can_build_f90 else 'NO')
-    print('  - build command line interfaces with click  :', 'YES' if can_build_cli else 'NO')
-    print('  - generate documentation with sphinx        :', 'YES' if can_build_doc else 'NO')
-    print('  - git                                       :', 'YES' if can_git       else 'NO')
-    print('  - create remote repositories at github.com  :', 'YES' if can_gh        else 'NO')
+    print('  - use poetry (e.g. `poetry publish --build`):', 'YES' if ready['poetry']    else 'NO')
+    print('  - use pytest for automating tests           :', 'YES' if ready['pytest']    else 'NO')
+    print('  - build binary extensions from C++          :', 'if a C++ compiler is available' if ready['build_cpp'] else 'NO')
+    print('  - build binary extensions from Fortra       :', 'if a Fortran and a C compiler are available' if ready['build_f90'] else 'NO')
+    print('  - build command line interfaces with click  :', 'YES' if ready['cli']       else 'NO')
+    print('  - generate documentation with sphinx        :', 'YES' if ready['doc']       else 'NO')
+    print('  - git                                       :', 'YES' if ready['git']       else 'NO')
+    print('  - create remote repositories at github.com  :', 'YES' if ready['gh']        else 'NO')
+
+    if options.verbosity > 1:
+        print(f'\nToolchain for building binary extensions (cached in {toolchain.cache_file()}):')
+        print(json.dumps(toolchain.get_toolchain(), indent=2))
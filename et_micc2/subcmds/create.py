@@ -156,6 +156,7 @@ def create(project):
                 )
             else:
                 with messages.log(project.logger.info, "Creating local git repository"):
+                    project.compact_components()
                     with utils.in_directory(project.context.project_path):
                         vs = toolinfo_git.version()
                         re_git_version = re.compile('^git version (\d+\.\d*\.\d*).*')
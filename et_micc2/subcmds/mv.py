@@ -13,6 +13,7 @@ def mv(project):
     """Rename, move or remove a component (submodule, Fortran/C++ binary extension module, or app (CLI)."""
     with utils.in_directory(project.context.project_path):
         if project.context.commit_msg:
+            project.compact_components()
             cmds = [['git', 'commit', '-a', '-m', project.context.commit_msg]]
             utils.execute(cmds, project.logger.debug, stop_on_error=True)
 
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Module et_micc2.tools.autobuild
+===============================
+
+Automatic building of missing binary extensions at import time.
+
+``micc2 add --cpp|--f90`` inserts a call to :py:func:`build_missing` in the package's
+:file:`__init__.py` for every binary extension module. As this runs each time the package is
+imported, the common case - the binary extension exists - must be cheap. This module therefore
+only depends on the standard library, and the project is only looked up when a build is needed.
+"""
+import importlib.machinery
+import os
+
+from et_micc2.tools.filelock import FileLock
+
+# The suffix of binary extension modules built for this Python, e.g. '.cpython-311-x86_64-linux-gnu.so'.
+# This is the same as sysconfig.get_config_var('EXT_SUFFIX'), but does not require loading the
+# build configuration of Python.
+_extension_suffix = importlib.machinery.EXTENSION_SUFFIXES[0]
+
+# Default maximum number of seconds to wait for another process building a binary extension.
+BUILD_LOCK_TIMEOUT = 1800.0
+
+
+def build_lock_timeout() -> float:
+    """Return the maximum number of seconds to wait for another process building a binary extension.
+
+    This is the value of the environment variable ``MICC2_BUILD_LOCK_TIMEOUT``, or
+    :py:data:`BUILD_LOCK_TIMEOUT` if it is not set or invalid. (An invalid value must not
+    break the import of the package.)
+    """
+    try:
+        return float(os.environ['MICC2_BUILD_LOCK_TIMEOUT'])
+    except (KeyError, ValueError):
+        return BUILD_LOCK_TIMEOUT
+
+
+def build_lock_path(binary: str) -> str:
+    """Return the path to the lock file for building binary extension *binary*.
+
+    The lock file is in the temporary directory, not next to the binary extension, so that
+    it does not clutter the package directory (and does not need an entry in the project's
+    :file:`.gitignore`), and so that a read-only package directory is not a problem. Its name
+    is derived from the absolute path of the binary extension. (The ``micc2 build`` process
+    itself still locks the extension's source directory, which also serialises builds
+    started from different hosts sharing the project directory.)
+    """
+    # These imports are only needed for building:
+    import hashlib
+    import tempfile
+    key = hashlib.sha1(os.path.abspath(binary).encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f'micc2-build-{key}.lock')
+
+
+class BinaryExtensionNotFoundError(ModuleNotFoundError):
+    """raised when trying to autobuild a binary extension."""
+
+
+def build_missing(package_location: str, module_to_build: str):
+    """Automatically build a binary extension if missing.
+
+    If the binary extension exists, this costs a single ``stat`` call. Otherwise, the first process
+    to acquire the lock file (see :py:func:`build_lock_path`) builds it, while other processes importing
+    the package concurrently (e.g. MPI ranks, or pytest-xdist workers) wait for the lock, and then
+    find the binary extension built. They wait at most :py:data:`BUILD_LOCK_TIMEOUT` seconds, which
+    can be set with the environment variable ``MICC2_BUILD_LOCK_TIMEOUT`` (see :py:func:`build_lock_timeout`).
+
+    Params:
+        package_location: location of the package's `__init__.py` file.
+        module_to_build: name of the module to be build, relative to the package.
+
+    Raises:
+        BinaryExtensionNotFoundError: if the build went wrong somehow, including timeouts and
+            errors creating the lock file or running ``micc2 build``.
+    """
+    so = os.path.join(os.path.dirname(package_location), module_to_build + _extension_suffix)
+    if os.path.isfile(so):
+        return
+
+    timeout = build_lock_timeout()
+    try:
+        with FileLock(build_lock_path(so), timeout=timeout):
+            if os.path.isfile(so):
+                # built by another process while we were waiting for the lock.
+                return
+            # These imports are only needed for building:
+            import subprocess
+            import et_micc2.tools.project as project
+            project_path = project.get_project_path(package_location)
+            completed_process = subprocess.run(
+                ['micc2', 'build', '--lock-timeout', str(timeout), module_to_build], cwd=project_path
+            )
+            if completed_process.returncode != 0 or not os.path.isfile(so):
+                raise BinaryExtensionNotFoundError(f"Failed auto-building {so}.")
+    except OSError as exc:
+        # FileLockTimeout is an OSError too
+        raise BinaryExtensionNotFoundError(f"Failed auto-building {so}:\n{exc}") from exc
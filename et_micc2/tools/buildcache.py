@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Module et_micc2.tools.buildcache
+================================
+
+Persistent record of the binary extensions built in a project.
+
+For every binary extension the cache keeps a fingerprint of everything that determines
+the outcome of the build: the source files (including :file:`CMakeLists.txt`), the build
+options, the compilers and the Python ABI. A binary extension whose fingerprint is unchanged,
+and whose binary is still the one that was installed by micc2, need not be rebuilt.
+
+Files outside the source directory that the build depends on, e.g. headers in the include
+directories and libraries to link against, are found in the dependency information of the
+build tree after a build (see :py:func:`dependencies`). Their size and modification time are
+recorded too, and checked before a binary extension is considered up to date.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+import subprocess
+import sys
+import sysconfig
+
+from et_micc2.tools.filelock import FileLock
+import et_micc2.tools.utils as utils
+
+BUILD_CACHE = 'micc-build.json'
+
+# Files and folders in the source directory of a binary extension that are not sources.
+_exclude = ('_cmake_build', '__pycache__', 'micc-build.log', 'micc-build.lock')
+
+
+def source_files(srcdir: Path) -> list:
+    """Return the sorted list of source files of a binary extension, relative to *srcdir*."""
+    files = []
+    for root, dirs, filenames in os.walk(srcdir):
+        dirs[:] = [d for d in dirs if not d in _exclude and not d.startswith('.')]
+        for filename in filenames:
+            if not filename in _exclude and not filename.startswith('.'):
+                files.append((Path(root) / filename).relative_to(srcdir))
+    return sorted(files)
+
+
+def compilers() -> dict:
+    """Return the compilers that CMake will pick up from the environment.
+
+    Only the environment is inspected, no compiler is executed.
+    """
+    result = {}
+    for var, default in (('CC', 'cc'), ('CXX', 'c++'), ('FC', 'gfortran')):
+        exe = os.environ.get(var, default)
+        which = shutil.which(exe)
+        result[var] = os.path.realpath(which) if which else exe
+    return result
+
+
+def build_settings(build_options) -> dict:
+    """Return the settings, other than the sources, that affect the build of a binary extension."""
+    return { 'submodule_type': build_options.submodule_type
+           , 'cmake'         : {key: str(val) for key, val in build_options.cmake.items()}
+           , 'compilers'     : compilers()
+           , 'python'        : sys.executable
+           , 'python_version': sys.version
+           , 'ext_suffix'    : sysconfig.get_config_var('EXT_SUFFIX')
+           }
+
+
+def fingerprint(build_options) -> str:
+    """Compute the fingerprint of a binary extension from its sources and build settings."""
+    srcdir = build_options.submodule_srcdir_path
+    h = hashlib.sha256()
+    for file in source_files(srcdir):
+        h.update(file.as_posix().encode())
+        h.update(b'\0')
+        h.update((srcdir / file).read_bytes())
+        h.update(b'\0')
+    h.update(json.dumps(build_settings(build_options), sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _depfile_dependencies(depfile: Path) -> list:
+    """Return the dependencies in a Makefile style dependency file (as generated by ``gcc -MD``)."""
+    deps = []
+    try:
+        text = depfile.read_text(errors='replace')
+    except OSError:
+        return deps
+    for line in text.replace('\\\n', ' ').splitlines():
+        if line.startswith('#') or not ': ' in line:
+            continue
+        deps.extend(line.split(': ', 1)[1].split())
+    return deps
+
+
+def _ninja_dependencies(build_dir: Path) -> list:
+    """Return the dependencies recorded by ninja in :file:`.ninja_deps` (``ninja -t deps``)."""
+    ninja = shutil.which('ninja')
+    if not ninja or not (build_dir / '.ninja_deps').exists():
+        return []
+    completed = subprocess.run([ninja, '-t', 'deps'], cwd=build_dir, capture_output=True, text=True)
+    if completed.returncode:
+        return []
+    return [line.strip() for line in completed.stdout.splitlines() if line.startswith(' ')]
+
+
+def _link_dependencies(build_dir: Path) -> list:
+    """Return the libraries, specified by an absolute path, in the link commands of the build tree."""
+    tokens = []
+    build_ninja = build_dir / 'build.ninja'
+    if build_ninja.exists():
+        for libraries in re.findall(r'^\s*LINK_LIBRARIES = (.*)$', build_ninja.read_text(errors='replace'), re.M):
+            tokens.extend(libraries.split())
+    for link_txt in (build_dir / 'CMakeFiles').glob('*/link.txt'):
+        # skip the linker
+        tokens.extend(link_txt.read_text(errors='replace').split()[1:])
+    return [token for token in tokens if os.path.isabs(token) and os.path.isfile(token)]
+
+
+def dependencies(build_options) -> dict:
+    """Return the files outside the source directory that the last build of a binary extension
+    depended on, with their size and modification time: {path: [size, mtime]}.
+
+    The dependencies are read from the build tree :file:`_cmake_build`: the dependency files
+    of the compiler (Makefile generators), the ninja dependency log (Ninja generator), and
+    the link commands.
+    """
+    srcdir = build_options.submodule_srcdir_path
+    build_dir = srcdir / '_cmake_build'
+    if not build_dir.is_dir():
+        return {}
+    deps = _ninja_dependencies(build_dir)
+    for depfile in build_dir.rglob('*.d'):
+        deps.extend(_depfile_dependencies(depfile))
+    deps.extend(_link_dependencies(build_dir))
+
+    result = {}
+    srcdirs = {srcdir, srcdir.resolve()}
+    for dep in deps:
+        path = Path(os.path.normpath(build_dir / dep))
+        if srcdirs & {path, *path.parents}:
+            # sources (and build artefacts) are covered by the fingerprint
+            continue
+        stat = _binary_stat(path)
+        if stat is not None:
+            result[str(path)] = stat
+    return result
+
+
+def _binary_stat(binary: Path):
+    """Return (size, mtime) of a binary, or None if it does not exist."""
+    try:
+        st = binary.stat()
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class BuildCache:
+    """The build cache of a project, stored in :file:`micc-build.json` in the project directory.
+
+    :param Path project_path: path to the project directory.
+    """
+    def __init__(self, project_path):
+        self.project_path = Path(project_path)
+        self.deserialize()
+
+
+    def deserialize(self):
+        """Read the build cache file into self.db."""
+        try:
+            with (self.project_path / BUILD_CACHE).open('r') as f:
+                self.db = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.db = {}
+
+
+    def serialize(self):
+        """Write self.db to the build cache file (atomically)."""
+        with utils.atomic_replace(self.project_path / BUILD_CACHE) as tmp:
+            with tmp.open('w') as f:
+                json.dump(self.db, f, indent=2)
+
+
+    def key(self, build_options) -> str:
+        """The key of a binary extension is the relative path of its source directory."""
+        return build_options.submodule_srcdir_path.relative_to(self.project_path).as_posix()
+
+
+    def is_up_to_date(self, build_options, fingerprint_: str) -> bool:
+        """Is the installed binary of a binary extension built from the sources and settings with
+        fingerprint *fingerprint_*?
+        """
+        entry = self.db.get(self.key(build_options))
+        if not entry or entry['fingerprint'] != fingerprint_ or not 'dependencies' in entry:
+            return False
+        # Verify that the binary is still the one that was installed by the build:
+        if entry['binary_stat'] != _binary_stat(build_options.submodule_binary):
+            return False
+        # Verify that the dependencies outside the source directory are unchanged:
+        for path, stat in entry['dependencies'].items():
+            if _binary_stat(Path(path)) != stat:
+                return False
+        return True
+
+
+    def update(self, build_options, fingerprint_: str, dependencies_=None):
+        """Record a successful build of a binary extension with fingerprint *fingerprint_*.
+
+        The dependencies outside the source directory are read from the build tree (see
+        :py:func:`dependencies`), unless they are passed as *dependencies_* (the build tree
+        is gone after ``micc2 build --cleanup``). The generator and compiler launcher are recorded too, but they
+        are not part of the fingerprint, as they do not affect the binary.
+        """
+        self.db[self.key(build_options)] = \
+            { 'fingerprint': fingerprint_
+            , 'binary'     : build_options.submodule_binary.relative_to(self.project_path).as_posix()
+            , 'binary_stat': _binary_stat(build_options.submodule_binary)
+            , 'dependencies': dependencies(build_options) if dependencies_ is None else dependencies_
+            , 'settings'   : build_settings(build_options)
+            , 'generator'  : getattr(build_options, 'generator', '')
+            , 'compiler_launcher': getattr(build_options, 'compiler_launcher', '')
+            }
+
+
+    def invalidate(self, build_options):
+        """Forget a binary extension, e.g. because its build failed."""
+        self.db.pop(self.key(build_options), None)
+
+
+    def store(self, build_options, fingerprint_=None, dependencies_=None):
+        """Record a successful build of a binary extension with fingerprint *fingerprint_* and
+        dependencies *dependencies_* (see :py:meth:`update`), or forget it if *fingerprint_* is
+        None, and write the build cache file.
+
+        The build cache file is re-read first, because other processes may have modified it.
+        """
+        with FileLock(self.project_path / f'{BUILD_CACHE}.lock'):
+            self.deserialize()
+            if fingerprint_ is None:
+                self.invalidate(build_options)
+            else:
+                self.update(build_options, fingerprint_, dependencies_)
+            self.serialize()
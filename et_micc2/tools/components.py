@@ -1,20 +1,102 @@
+import functools
 import json
 import os
 from pathlib import Path
+import sqlite3
 from types import SimpleNamespace
 
+from et_micc2.tools.profiling import timed
 import et_micc2.tools.utils as utils
 
+COMPONENTS_JSON = 'components.json'
+COMPONENTS_JOURNAL = 'components.journal'
+COMPONENTS_DB = 'components.db'
+# The journal is compacted into components.json when it has more entries than this:
+JOURNAL_MAX_ENTRIES = 32
+
+
+def open_component_database(project_path, backend: str = 'json'):
+    """Open the components database of a project.
+
+    If the project has a :file:`components.db` file, or if *backend* is ``'sqlite'`` and the
+    project directory exists, a :py:class:`SQLiteComponentDatabase` is returned, otherwise a
+    :py:class:`ComponentDatabase`. The backend is chosen with the ``components_backend``
+    preference in the micc2 configuration file, which can be set with
+    ``micc2 --components-backend sqlite setup``.
+
+    :param Path project_path: path to the project directory.
+    :param str backend: ``'json'`` or ``'sqlite'``.
+    """
+    project_path = Path(project_path)
+    if (project_path / COMPONENTS_DB).exists() or (backend == 'sqlite' and project_path.is_dir()):
+        return SQLiteComponentDatabase(project_path)
+    return ComponentDatabase(project_path)
+
+
+def serializable_component(component, verbose=False) -> str:
+    """Make the context of *component* json serializable, and return the component's key.
+
+    :param dict component: a component with a 'context' entry.
+    """
+    # components[i].context is a SimpleNamespace object which is not default json serializable.
+    # This function takes care of that by converting to `str` where possible, and
+    # ignoring objects that do not need serialization, as e.g. self.context.logger.
+    serializable_context = {}
+    context = component['context']
+    if isinstance(context, SimpleNamespace):
+        context = context.__dict__
+    for key, val in context.items():
+        if isinstance(val, (dict, list, tuple, str, int, float, bool)):
+            # default serializable types
+            serializable_context[key] = val
+            if verbose:
+                print(f"serialize_db: using ({key}:{val})")
+        elif isinstance(val, Path):
+            serializable_context[key] = str(val)
+            if verbose:
+                print(f"serialize_db: using ({key}:str('{val}'))")
+        else:
+            if verbose:
+                print(f"serialize_db: ignoring ({key}:{val})")
+    component['context'] = serializable_context
+    return context['add_name']
+
+
+def trigrams(s: str) -> set:
+    """Return the set of substrings of length 3 of *s*."""
+    return {s[i:i+3] for i in range(len(s) - 2)}
+
+
 class ComponentDatabase:
+    """The database of the components of a project, stored in :file:`components.json`.
+
+    To avoid scanning all components on every lookup, two secondary indexes are maintained:
+
+    * ``self.names``: {leaf name: [component keys]}, used by :py:meth:`has_name`,
+    * ``self.trigrams``: {trigram: {component keys}}, used by :py:meth:`similar_to`.
+
+    The indexes are built by :py:meth:`deserialize` and kept up to date when components are
+    inserted or deleted through the ``[]`` operator.
+
+    Changes are not written to :file:`components.json` right away, but appended to the journal
+    :file:`components.journal` by :py:meth:`serialize`, one JSON line per inserted or deleted
+    component. When the journal grows beyond ``JOURNAL_MAX_ENTRIES`` entries, it is compacted:
+    :file:`components.json` is rewritten atomically and the journal is removed. Hence, a crash
+    can at most lose the last change.
+
+    Only :file:`components.json` is under version control, the journal is not. Commands that
+    commit to the project's git repository compact the journal first (see
+    :py:meth:`et_micc2.tools.project.Project.compact_components`).
+    """
     def __init__(self, project_path):
         self.project_path = project_path
         self.deserialize()
 
 
     def deserialize(self):
-        """Read file ``db.json`` into self.db."""
+        """Read file ``components.json`` into self.db, and replay the journal."""
 
-        components_json = self.project_path / 'components.json'
+        components_json = self.project_path / COMPONENTS_JSON
         try:
             with components_json.open('r') as f:
                 self.db = json.load(f)
@@ -24,47 +106,83 @@ class ComponentDatabase:
             try:
                 db_json.rename(components_json)
                 self.deserialize()
+                return
             except FileNotFoundError:
                 self.db = {}
+        # changes not yet written to the journal:
+        self.pending = []
+        self.replay_journal()
+        self.build_indexes()
+
+
+    def replay_journal(self):
+        """Apply the entries in the journal to self.db."""
+        self.journal_entries = 0
+        self.journal_truncated = False
+        try:
+            with (self.project_path / COMPONENTS_JOURNAL).open('r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line was truncated by an interrupted write. The journal
+                        # must be compacted before anything is appended to it.
+                        self.journal_truncated = True
+                        break
+                    if entry['op'] == 'set':
+                        self.db[entry['key']] = entry['value']
+                    else:
+                        self.db.pop(entry['key'], None)
+                    self.journal_entries += 1
+        except FileNotFoundError:
+            pass
+
+
+    def build_indexes(self):
+        """Build the secondary indexes of self.db from scratch."""
+        self.names = {}
+        self.trigrams = {}
+        for key in self.db:
+            self._index(key)
+
 
+    def _index(self, key):
+        """Add *key* to the secondary indexes."""
+        self.names.setdefault(Path(key).name, []).append(key)
+        for trigram in trigrams(key):
+            self.trigrams.setdefault(trigram, set()).add(key)
 
+
+    def _unindex(self, key):
+        """Remove *key* from the secondary indexes."""
+        name = Path(key).name
+        keys = self.names.get(name, [])
+        if key in keys:
+            keys.remove(key)
+        if not keys:
+            self.names.pop(name, None)
+        for trigram in trigrams(key):
+            keys = self.trigrams.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.trigrams[trigram]
+
+
+    @timed('serialization')
     def serialize(self, new_components=[], logger=None, verbose=False):
-        """Insert components and write self.db to file ``db.json``.
+        """Insert components and write the changes to self.db to the journal.
 
         Params:
             values: list of components to insert before serializing.
         """
-        # components[i].context is a SimpleNamespace object which is not default json serializable.
-        # This function takes care of that by converting to `str` where possible, and
-        # ignoring objects that do not need serialization, as e.g. self.context.logger.
-
         if not isinstance(new_components,list):
             new_components = [new_components]
         new_components = [component for component in new_components if not component is None]
-        if not self.db and not new_components:
-            return
 
         for component in new_components:
             # produce a json serializable version of db_entry['context']:
-            serializable_context = {}
-            context = component['context']
-            if isinstance(context, SimpleNamespace):
-                context = context.__dict__
-            for key, val in context.items():
-                if isinstance(val, (dict, list, tuple, str, int, float, bool)):
-                    # default serializable types
-                    serializable_context[key] = val
-                    if verbose:
-                        print(f"serialize_db: using ({key}:{val})")
-                elif isinstance(val, Path):
-                    serializable_context[key] = str(val)
-                    if verbose:
-                        print(f"serialize_db: using ({key}:str('{val}'))")
-                else:
-                    if verbose:
-                        print(f"serialize_db: ignoring ({key}:{val})")
-            component_key = context['add_name']
-            component['context'] = serializable_context
+            component_key = serializable_component(component, verbose)
 
             if not hasattr(self, 'db'):
                 # Read db.json into self.db if self.db does not yet exist.
@@ -73,15 +191,40 @@ class ComponentDatabase:
             # Update the database:
             if logger:
                 logger.info(f"Updating database entry for : '{component_key}'")
-            self.db[component_key] = component
+            self[component_key] = component
 
-        # finally, serialize self.db
+        # finally, write the changes to the journal, or compact it
+        if not self.pending:
+            return
 
         if logger:
             logger.info(f"Serializing components database.")
-        with utils.in_directory(self.project_path):
-            with open('components.json', 'w') as f:
+        if self.journal_truncated \
+        or self.journal_entries + len(self.pending) > JOURNAL_MAX_ENTRIES \
+        or not (self.project_path / COMPONENTS_JSON).exists():
+            self.compact()
+        else:
+            journal = self.project_path / COMPONENTS_JOURNAL
+            with journal.open('a') as f:
+                for entry in self.pending:
+                    f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_entries += len(self.pending)
+        self.pending = []
+
+
+    def compact(self):
+        """Write self.db to ``components.json`` (atomically), and remove the journal."""
+        with utils.atomic_replace(self.project_path / COMPONENTS_JSON) as tmp:
+            with tmp.open('w') as f:
                 json.dump(self.db, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+        (self.project_path / COMPONENTS_JOURNAL).unlink(missing_ok=True)
+        self.journal_entries = 0
+        self.journal_truncated = False
+        self.pending = []
 
 
     def has_name(self, name) -> str:
@@ -90,27 +233,320 @@ class ComponentDatabase:
         name = str(name)
         if os.sep in name:
             name = Path(name).name
-        for key,v in self.db.items():
-            k_name = Path(key).name
-            if name == k_name:
-                return key
-        return ''
+        keys = self.names.get(name)
+        return keys[0] if keys else ''
 
 
     def similar_to(self, name: str) -> list:
-        """Return all components containing name."""
-        similar = []
-        for key,v in self.db.items():
-            if name in key:
-                similar.append(key)
-        return similar
+        """Return all components containing name, sorted."""
+        name = str(name)
+        if len(name) < 3:
+            # too short for the trigram index
+            candidates = self.db
+        else:
+            candidates = None
+            for trigram in trigrams(name):
+                keys = self.trigrams.get(trigram)
+                if not keys:
+                    return []
+                candidates = set(keys) if candidates is None else candidates & keys
+        # the trigrams of name may occur in a key without name itself occurring in it:
+        return sorted(key for key in candidates if name in key)
 
     ## forwarding methods
     def __getitem__(self, key):
         return self.db.__getitem__(key)
 
+    def __setitem__(self, key, value):
+        if key in self.db:
+            self._unindex(key)
+        self.db.__setitem__(key, value)
+        self._index(key)
+        self.pending.append({'op': 'set', 'key': key, 'value': value})
+
     def __delitem__(self, key):
         self.db.__delitem__(key)
+        self._unindex(key)
+        self.pending.append({'op': 'del', 'key': key})
+
+    def __contains__(self, key):
+        return self.db.__contains__(key)
+
+
+_SCHEMA = ( 'CREATE TABLE IF NOT EXISTS components (key TEXT PRIMARY KEY, name TEXT NOT NULL, value TEXT NOT NULL);\n'
+          + 'CREATE INDEX IF NOT EXISTS components_name ON components (name);\n'
+          + 'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);\n'
+          )
+
+
+@functools.lru_cache(maxsize=None)
+def fts_available() -> bool:
+    """Does this SQLite support full text search (fts5) with the trigram tokenizer?"""
+    try:
+        sqlite3.connect(':memory:').execute(
+            "CREATE VIRTUAL TABLE t USING fts5(key, tokenize='trigram case_sensitive 1')"
+        )
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+class SQLiteComponentDatabase:
+    """The database of the components of a project, stored in the SQLite database :file:`components.db`.
+
+    This is an alternative to :py:class:`ComponentDatabase` for projects with many components,
+    or which are modified by concurrent micc2 commands. Components are not loaded in memory,
+    but queried when needed. The leaf names of the components are indexed for :py:meth:`has_name`,
+    and, if SQLite supports it, a full text search table with a trigram tokenizer serves
+    :py:meth:`similar_to`. The database is opened in WAL mode, so that readers do not block
+    while a micc2 command is writing.
+
+    Changes become visible to other processes when :py:meth:`serialize` commits them.
+
+    :file:`components.json` remains the source of truth, which is under version control, while
+    :file:`components.db` is a local file, ignored by git. :py:meth:`serialize` rewrites
+    :file:`components.json` with every change it commits (so writes are not cheaper than with
+    :py:class:`ComponentDatabase`, only lookups are). If :file:`components.json` was modified
+    otherwise, e.g. by ``git pull``, the database is reloaded from it (see :py:meth:`sync`).
+    """
+    def __init__(self, project_path):
+        self.project_path = Path(project_path)
+        self.deserialize()
+
+
+    def deserialize(self):
+        """Open :file:`components.db`, creating and migrating it if necessary."""
+        db_path = self.project_path / COMPONENTS_DB
+        if not db_path.exists():
+            self.create()
+        self.connection = sqlite3.connect(str(db_path), timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(_SCHEMA)
+        self.setup_fts()
+        self.sync()
+
+
+    def create(self):
+        """Create :file:`components.db`, and load the components in :file:`components.json`
+        (and its journal) into it.
+
+        The database is built in a temporary file, which becomes :file:`components.db` only if
+        loading succeeds. Otherwise, the next micc2 command retries.
+        """
+        db_path = self.project_path / COMPONENTS_DB
+        tmp = db_path.with_name(f'.{COMPONENTS_DB}.{os.getpid()}.tmp')
+        try:
+            connection = sqlite3.connect(str(tmp))
+            try:
+                connection.executescript(_SCHEMA)
+                with connection:
+                    self.load(connection)
+            finally:
+                connection.close()
+            try:
+                # unlike os.replace, this fails if another process created components.db meanwhile
+                os.link(tmp, db_path)
+            except FileExistsError:
+                return
+            except OSError:
+                # no hard links on this file system
+                os.replace(tmp, db_path)
+        finally:
+            try:
+                tmp.unlink()
+            except FileNotFoundError:
+                pass
+
+
+    def _json_stamp(self) -> str:
+        """Return the size and modification time of :file:`components.json`, or '' if it does not exist."""
+        try:
+            st = (self.project_path / COMPONENTS_JSON).stat()
+        except FileNotFoundError:
+            return ''
+        return f'{st.st_size} {st.st_mtime_ns}'
+
+
+    def _record_json_stamp(self, connection):
+        """Record that the database is in sync with :file:`components.json`."""
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('components_json', ?)", (self._json_stamp(),))
+
+
+    def _in_sync(self, connection) -> bool:
+        """Is the database in sync with :file:`components.json`, and is there no journal?"""
+        if (self.project_path / COMPONENTS_JOURNAL).exists():
+            return False
+        row = connection.execute("SELECT value FROM meta WHERE key = 'components_json'").fetchone()
+        return bool(row) and row[0] == self._json_stamp()
+
+
+    def load(self, connection):
+        """Replace the components in the database with those in :file:`components.json` (and its
+        journal, which is then compacted into :file:`components.json`).
+
+        This must be executed in a transaction.
+        """
+        components_json = self.project_path / COMPONENTS_JSON
+        if components_json.exists() or (self.project_path / 'db.json').exists():
+            db = ComponentDatabase(self.project_path).db
+        else:
+            db = {}
+        connection.execute('DELETE FROM components')
+        connection.executemany(
+            'INSERT INTO components (key, name, value) VALUES (?, ?, ?)',
+            [(key, Path(key).name, json.dumps(component)) for key, component in db.items()]
+        )
+        if (self.project_path / COMPONENTS_JOURNAL).exists():
+            self.export(connection)
+        else:
+            self._record_json_stamp(connection)
+
+
+    def sync(self):
+        """Reload the database from :file:`components.json` if that was modified by something
+        else than this class, e.g. by ``git pull`` or ``git checkout``, or if there is a journal
+        (written by :py:class:`ComponentDatabase`).
+        """
+        if self._in_sync(self.connection):
+            return
+        with self.connection:
+            # Check again, now that we have the write lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            if not self._in_sync(self.connection):
+                self.load(self.connection)
+
+
+    def export(self, connection):
+        """Write the components in the database to :file:`components.json` (atomically), and
+        remove the journal, if any.
+
+        This must be executed in a write transaction, so that no other process can modify the
+        database before the export is recorded.
+        """
+        db = {key: json.loads(value) for key, value in connection.execute('SELECT key, value FROM components ORDER BY rowid')}
+        with utils.atomic_replace(self.project_path / COMPONENTS_JSON) as tmp:
+            with tmp.open('w') as f:
+                json.dump(db, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+        (self.project_path / COMPONENTS_JOURNAL).unlink(missing_ok=True)
+        self._record_json_stamp(connection)
+
+
+    def compact(self):
+        """Commit the changes, and write the components to :file:`components.json` (see :py:meth:`export`)."""
+        with self.connection:
+            if not self.connection.in_transaction:
+                self.connection.execute('BEGIN IMMEDIATE')
+            self.export(self.connection)
+
+
+    def setup_fts(self):
+        """Set up the full text search table for :py:meth:`similar_to`, if SQLite supports it.
+
+        The database may be used by SQLite versions with and without support for the fts5
+        trigram tokenizer. If this SQLite has no support, the triggers that keep the full text
+        search table up to date are dropped, as they would make every insert fail. If it has,
+        and the triggers are missing, the full text search table is (re)built from scratch.
+        """
+        self.fts = fts_available()
+        if not self.fts:
+            self.connection.executescript(
+                'DROP TRIGGER IF EXISTS components_insert;\n'
+                'DROP TRIGGER IF EXISTS components_delete;\n'
+            )
+            return
+        triggers = {name for name, in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        if {'components_insert', 'components_delete'} <= triggers:
+            return
+        self.connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS components_fts USING fts5(key, tokenize='trigram case_sensitive 1')"
+        )
+        with self.connection:
+            self.connection.execute('DELETE FROM components_fts')
+            self.connection.execute('INSERT INTO components_fts (rowid, key) SELECT rowid, key FROM components')
+            self.connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS components_insert AFTER INSERT ON components BEGIN\n'
+                '    INSERT INTO components_fts (rowid, key) VALUES (new.rowid, new.key);\n'
+                'END'
+            )
+            self.connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS components_delete AFTER DELETE ON components BEGIN\n'
+                '    DELETE FROM components_fts WHERE rowid = old.rowid;\n'
+                'END'
+            )
+
+
+    @timed('serialization')
+    def serialize(self, new_components=[], logger=None, verbose=False):
+        """Insert components and commit the changes to the database.
+
+        Params:
+            values: list of components to insert before serializing.
+        """
+        if not isinstance(new_components,list):
+            new_components = [new_components]
+        new_components = [component for component in new_components if not component is None]
+
+        for component in new_components:
+            component_key = serializable_component(component, verbose)
+            if logger:
+                logger.info(f"Updating database entry for : '{component_key}'")
+            self[component_key] = component
+
+        if self.connection.in_transaction:
+            if logger:
+                logger.info("Serializing components database.")
+            self.export(self.connection)
+            self.connection.commit()
+
+
+    def has_name(self, name) -> str:
+        """Is there a component with name <name>. Returns the relative path of the component as a str."""
+        name = str(name)
+        if os.sep in name:
+            name = Path(name).name
+        row = self.connection.execute(
+            'SELECT key FROM components WHERE name = ? ORDER BY rowid LIMIT 1', (name,)
+        ).fetchone()
+        return row[0] if row else ''
+
+
+    def similar_to(self, name: str) -> list:
+        """Return all components containing name, sorted."""
+        name = str(name)
+        if self.fts and len(name) >= 3:
+            query = 'SELECT key FROM components_fts WHERE key MATCH ?'
+            parameter = '"' + name.replace('"', '""') + '"'
+        else:
+            # too short for the trigram index
+            query = 'SELECT key FROM components WHERE instr(key, ?) > 0'
+            parameter = name
+        return sorted(key for key, in self.connection.execute(query, (parameter,)) if name in key)
+
+
+    def close(self):
+        """Close the database, discarding uncommitted changes."""
+        self.connection.close()
+
+    ## dict-like methods
+    def __getitem__(self, key):
+        row = self.connection.execute('SELECT value FROM components WHERE key = ?', (str(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        key = str(key)
+        # DELETE + INSERT rather than REPLACE, to trigger the update of the full text search table
+        self.connection.execute('DELETE FROM components WHERE key = ?', (key,))
+        self.connection.execute(
+            'INSERT INTO components (key, name, value) VALUES (?, ?, ?)', (key, Path(key).name, json.dumps(value))
+        )
+
+    def __delitem__(self, key):
+        if not self.connection.execute('DELETE FROM components WHERE key = ?', (str(key),)).rowcount:
+            raise KeyError(key)
 
     def __contains__(self, key):
-        return self.db.__contains__(key)
\ No newline at end of file
+        return self.connection.execute('SELECT 1 FROM components WHERE key = ?', (str(key),)).fetchone() is not None
@@ -8,6 +8,8 @@ from pathlib import Path
 import json
 import click
 
+from et_micc2.tools.profiling import timed
+
 class Config:
     """Class for configuration (or preferences) files.
 
@@ -29,6 +31,7 @@ class Config:
         kwargs.pop(Config.file_key,None)
         self.add(**kwargs)
 
+    @timed('config load')
     def load(self, p_cfg):
         """
 
@@ -57,6 +60,7 @@ class Config:
         self.update_location_(self.p_cfg)
 
 
+    @timed('serialization')
     def save(self, file='', mkdir=False):
         """Save self.data to cfg file. If file is not specified """
         if file:
@@ -1,7 +1,14 @@
+import concurrent.futures
+import functools
+try:
+    import importlib.metadata as importlib_metadata
+except ImportError:
+    # Python < 3.8
+    import importlib_metadata
 import os
+import re
 import typing
 from pathlib import Path
-import pkg_resources
 import semantic_version
 import shutil
 import subprocess
@@ -28,6 +35,65 @@ def is_os_tool(path_to_exe):
     return path_to_exe.startswith('/usr/bin')
 
 
+# The environment does not change during the lifetime of a micc2 process. Hence, the probes
+# below, which search the PATH, run subprocesses or scan site-packages, are executed only once
+# per tool or package, and their results are memoized.
+
+@functools.lru_cache(maxsize=None)
+def which(exe):
+    """Memoized :py:func:`shutil.which`."""
+    return shutil.which(exe)
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(exe):
+    """Return the output of ``exe --version`` (memoized)."""
+    completed_version = subprocess.run([exe, '--version'], capture_output=True, text=True)
+    return completed_version.stdout.strip().replace('\n\n','\n')
+
+
+@functools.lru_cache(maxsize=None)
+def get_distribution(pkg_name):
+    """Return the :py:class:`importlib.metadata.Distribution` of Python package *pkg_name*, or
+    None if it is not installed (memoized).
+
+    Unlike ``pkg_resources``, :py:mod:`importlib.metadata` does not scan all installed
+    distributions up front: every lookup only searches for the requested one.
+    """
+    try:
+        return importlib_metadata.distribution(pkg_name)
+    except importlib_metadata.PackageNotFoundError:
+        return None
+
+
+def probe_tools(exes, versions=True, max_workers=None):
+    """Probe a number of tools concurrently, and memoize the results.
+
+    Subsequent :py:class:`ToolInfo` objects for these tools do not need to search the PATH or
+    run ``exe --version`` again.
+
+    :param exes: list of executable names.
+    :param bool versions: also probe the versions of the tools that are found.
+    :param max_workers: maximum number of threads, see :py:class:`concurrent.futures.ThreadPoolExecutor`.
+    :return: dict mapping the executable names to their :py:class:`ToolInfo`.
+    """
+    def probe(exe):
+        toolinfo = ToolInfo(exe)
+        if versions:
+            toolinfo.version()
+        return toolinfo
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(exes, executor.map(probe, exes)))
+
+
+def clear_caches():
+    """Forget the memoized probes, e.g. after modifying the environment."""
+    which.cache_clear()
+    tool_version.cache_clear()
+    get_distribution.cache_clear()
+
+
 class PkgInfo:
     mock = [] # list of module names to pretend missing. This is just for testing purposes.
 
@@ -36,12 +102,8 @@ class PkgInfo:
             print(f'Mock: pretending module `{pkg_name}` is missing.')
             self.which = ''
         else:
-            try:
-                self.pkg_dist_info = pkg_resources.get_distribution(pkg_name)
-            except pkg_resources.DistributionNotFound:
-                self.which = ''
-            else:
-                self.which = self.pkg_dist_info.location
+            self.pkg_dist_info = get_distribution(pkg_name)
+            self.which = str(self.pkg_dist_info.locate_file('')) if self.pkg_dist_info else ''
 
     def is_available(self):
         """Return True if the tool is available, False otherwise."""
@@ -71,9 +133,7 @@ class ToolInfo:
             print(f'Mock: pretending tool `{exe}` is missing.')
             self.which = ''
         else:
-            # completed_which = subprocess.run(['which', exe], capture_output=True, text=True)
-            # self.which = completed_which.stdout.strip().replace('\n', ' ')
-            self.which = shutil.which(exe)
+            self.which = which(exe)
 
         if self.which:
             if on_vsc_cluster() and not accept_cluster_os_tools and is_os_tool(self.which):
@@ -85,12 +145,7 @@ class ToolInfo:
 
     def version(self):
         """Return the version string of the tool, or an empty string if the tool is not available."""
-        if self.which:
-            completed_version = subprocess.run([self.exe, '--version'], capture_output=True, text=True)
-            self.version = completed_version.stdout.strip().replace('\n\n','\n')#.replace('\n','\n        ')
-        else:
-            self.version = ''
-        return self.version
+        return tool_version(self.exe) if self.which else ''
 
 
 def verify_project_name(project_name):
@@ -112,7 +167,7 @@ def check_pybind11(required=False):
             '  - run `pip install pybind11 [--user]``\n'
         )
         if required:
-            messages.error(msg, ExitCodes.MISSING_COMPONENT)
+            messages.error(msg, messages.ExitCodes.MISSING_COMPONENT)
         else:
             messages.warning(msg)
     else:
@@ -134,7 +189,7 @@ def check_f2py(required=False):
             '  - elsewhere  `pip install numpy [--user]`'
         )
         if required:
-            messages.error(msg, ExitCodes.MISSING_COMPONENT)
+            messages.error(msg, messages.ExitCodes.MISSING_COMPONENT)
         else:
             messages.warning(msg)
 
@@ -9,10 +9,12 @@ Helper functions for dealing with *Cookiecutter* templates.
 import os, shutil, platform
 from pathlib import Path
 import json
+import time
 
 import click
 
 import et_micc2.tools.messages as messages
+from et_micc2.tools.profiling import timed
 
 EXIT_OVERWRITE = -3
 __FILE__ = Path(__file__).resolve()
@@ -24,7 +26,13 @@ import et_micc2.tools.tmpl as tmpl
 _path_to_templates = Path(et_micc2.__file__).parent / 'templates'
 
 
-def expand_templates(options):
+def plan_templates(options):
+    """Expand the templates in options.templates in memory.
+
+    :return: a :py:class:`et_micc2.tools.tmpl.Plan`.
+    :raise: ValueError if a parameter is missing in any of the templates.
+    """
+    plan = tmpl.Plan()
     for template in options.templates:
         path_to_template = _path_to_templates / template
         if not path_to_template.exists():
@@ -37,10 +45,37 @@ def expand_templates(options):
                 destination = options.project_path / options.package_name / options.module_location_relative
         else: # not a sub-module, either top-level package or cli
             destination = options.project_path.parent
-        try:
-            tmpl.expand_folder(path_to_template, destination, options.template_parameters.data)
-        except ValueError as exc:
-            return exc.args[0]
+        plan.add_folder(path_to_template, destination, options.template_parameters.data)
+    return plan
+
+
+@timed('template expansion')
+def expand_templates(options):
+    """Expand the templates in options.templates.
+
+    All templates are expanded and validated in memory before anything is written, so that a
+    missing parameter does not leave partial output behind. If ``options.dry_run`` is set,
+    the plan is only reported, nothing is written.
+
+    :return: an error message if a parameter is missing, None otherwise.
+    """
+    try:
+        plan = plan_templates(options)
+    except ValueError as exc:
+        return exc.args[0]
+
+    dry_run = getattr(options, 'dry_run', False)
+    logger = getattr(options, 'logger', None)
+    report = plan.report(verbose=dry_run or getattr(options, 'verbosity', 1) > 2)
+    if dry_run:
+        print(f"Dry run, nothing written: {report}")
+        return
+    if logger:
+        logger.debug(report)
+    start = time.perf_counter()
+    plan.commit()
+    if logger:
+        logger.debug(f"{len(plan.files)} files written in {time.perf_counter() - start:.3f}s.")
 
 
 def resolve_template(template):
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Module et_micc2.tools.filelock
+==============================
+
+An inter-process lock based on a lock file.
+
+The lock is an advisory operating system lock on the lock file (``flock`` on Posix systems,
+``msvcrt.locking`` on Windows). The operating system releases it when the process holding
+it terminates, so a crashing process does not leave a stale lock behind.
+
+This module only depends on the standard library, because it is used when binary extensions
+are built automatically at import time.
+"""
+import os
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLockTimeout(TimeoutError):
+    """Raised when a :py:class:`FileLock` could not be acquired in time."""
+
+
+class FileLock:
+    """Context manager for an exclusive lock on file *path*.
+
+    :param path: path to the lock file. It is created if it does not exist.
+    :param timeout: maximum number of seconds to wait for the lock. None waits forever.
+    :param poll_interval: number of seconds between attempts to acquire the lock.
+    """
+    def __init__(self, path, timeout=None, poll_interval=0.1):
+        self.path = str(path)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+
+    def acquire(self):
+        """Acquire the lock, waiting at most self.timeout seconds.
+
+        :raises FileLockTimeout: if the lock was not acquired in time.
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        start = time.monotonic()
+        while True:
+            try:
+                if os.name == 'nt':
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                if self.timeout is not None and time.monotonic() - start >= self.timeout:
+                    os.close(fd)
+                    raise FileLockTimeout(f"Timeout ({self.timeout}s) acquiring lock {self.path}.")
+                time.sleep(self.poll_interval)
+            else:
+                self._fd = fd
+                return self
+
+
+    def release(self):
+        """Release the lock."""
+        if self._fd is None:
+            return
+        try:
+            if os.name == 'nt':
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+    @property
+    def is_locked(self):
+        """Does this object hold the lock?"""
+        return self._fd is not None
+
+
+    def __enter__(self):
+        return self.acquire()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -9,8 +9,10 @@ Helper functions for logging.
 from contextlib import contextmanager
 from datetime import datetime
 from enum import Enum
+import json
 import logging
 import sys
+import time
 
 import click
 
@@ -94,15 +96,44 @@ def verbosity_to_loglevel(verbosity):
 #     return get_micc_logger.the_logger
 #
 
+class Span:
+    """A timed block of a command, as bracketed by :py:func:`log`.
+
+    :param str name: description of the block.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.children = []
+        self.start = time.perf_counter()
+        self.duration = None
+
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.start
+
+
+    def walk(self, depth=0, parent=''):
+        """Iterate over (depth, path, span) of this span and its descendants, slowest first."""
+        path = f"{parent}/{self.name}" if parent else self.name
+        yield depth, path, self
+        for child in sorted(self.children, key=lambda span: -(span.duration or 0)):
+            yield from child.walk(depth + 1, path)
+
+
 class IndentingLogger(logging.Logger):
     """Cuastom Logger class for creating indented logs.
     
     This is the class for the et_micc2 logger.
+
+    Blocks bracketed by :py:func:`log` are also timed. The timed blocks form a tree of
+    :py:class:`Span` objects, with roots in self.spans.
     """
     def __init__(self, name, level=logging.NOTSET):
         super().__init__(name, level)
         self._indent = ''
         self._stack = []
+        self.spans = []       # the root spans
+        self._open_spans = [] # the spans that have not yet finished, innermost last
         
         
     def _log(self, level, msg, args, exc_info=None, extra=None, stack_info=False):
@@ -136,15 +167,66 @@ class IndentingLogger(logging.Logger):
             self._indent = self._indent[0:length]
 
 
-def create_logger(path_to_log_file,filemode='a'):
+    def begin_span(self, name):
+        """Start timing a block, nested in the current block, if any."""
+        span = Span(name)
+        if self._open_spans:
+            self._open_spans[-1].children.append(span)
+        else:
+            self.spans.append(span)
+        self._open_spans.append(span)
+        return span
+
+
+    def end_span(self):
+        """Stop timing the current block, and return its span."""
+        span = self._open_spans.pop()
+        span.stop()
+        return span
+
+
+    def add_spans(self, spans):
+        """Add blocks timed by another logger (e.g. in another process) to the current block, if any."""
+        if self._open_spans:
+            self._open_spans[-1].children.extend(spans)
+        else:
+            self.spans.extend(spans)
+
+
+    def span_summary(self):
+        """Return the timed blocks as an indented tree, slowest first."""
+        lines = []
+        for root in sorted(self.spans, key=lambda span: -(span.duration or 0)):
+            for depth, path, span in root.walk():
+                duration = f"{span.duration:8.3f}s" if span.duration is not None else ' running '
+                lines.append(f"{duration} {depth*'    '}{span.name}")
+        return '\n'.join(lines)
+
+
+    def span_records(self):
+        """Return the timed blocks as a list of dicts (one per span, parents before children)."""
+        records = []
+        for root in self.spans:
+            for depth, path, span in root.walk():
+                records.append({'name': span.name, 'path': path, 'depth': depth, 'duration': span.duration})
+        return records
+
+
+    def write_spans_json(self, path):
+        """Append the timed blocks to file *path* as JSON lines."""
+        with open(path, 'a') as f:
+            for record in self.span_records():
+                f.write(json.dumps(record) + '\n')
+
+
+def create_logger(path_to_log_file,filemode='a',use_logfile=False,console=True):
     """Create a logger object for et_micc2.
     
     It will log to:
     
-    * the console
-    * file *path_to_log_file*. By default log message will be appended to the
+    * the console, if *console* is True
+    * file *path_to_log_file*, if *use_logfile* is True. By default log message will be appended to the
     """
-    use_logfile = False
     # create formatters and add it to the handlers
     format_string = f"[%(levelname)s] %(message)s"
     console_formatter = logging.Formatter(format_string)
@@ -165,7 +247,8 @@ def create_logger(path_to_log_file,filemode='a'):
     # create logger
     logger = IndentingLogger(name="ok")
     logger.setLevel(logging.DEBUG)
-    logger.addHandler(console_handler)
+    if console:
+        logger.addHandler(console_handler)
     if use_logfile:
         logger.addHandler(logfile_handler)
 
@@ -178,6 +261,13 @@ def create_logger(path_to_log_file,filemode='a'):
     return logger
 
 
+def close_logger(logger):
+    """Close the handlers of a logger created with :py:func:`create_logger`, e.g. to release its log file."""
+    for handler in list(logger.handlers):
+        handler.close()
+        logger.removeHandler(handler)
+
+
 @contextmanager
 def log(logfun=None, before='doing', after='done.',bracket=True):
     """Print a message before and after executing the body of the contextmanager.
@@ -187,23 +277,28 @@ def log(logfun=None, before='doing', after='done.',bracket=True):
     :param str after: print this after body is executed
     :param bool bracket: append ' [' to before and prepend '] ' to after.
     
-    This works best with the :py:class:`~et_micc2.logger.IndentingLogger`.
+    This works best with the :py:class:`~et_micc2.logger.IndentingLogger`, which also records
+    the duration of the body (see :py:meth:`IndentingLogger.span_summary`). The duration is
+    appended to the *after* message.
     """
     if logfun:
-        if bracket:
-            msg = '[ ' + before
+        msg = '[ ' + before if bracket else before
         logfun(msg)
-        try:
-            logfun.__self__.indent()
-            is_logger = True
-        except AttributeError:
-            is_logger = False
-    yield
+        logger = getattr(logfun, '__self__', None)
+        is_logger = isinstance(logger, IndentingLogger)
+        if is_logger:
+            logger.indent()
+            logger.begin_span(before.strip().split('\n')[0])
+    try:
+        yield
+    finally:
+        if logfun and is_logger:
+            span = logger.end_span()
+            logger.dedent()
     if logfun:
+        msg = '] '+ after if bracket else after
         if is_logger:
-            logfun.__self__.dedent()
-        if bracket:
-            msg = '] '+ after
+            msg += f" ({span.duration:.3f}s)"
         logfun(msg)
 
 
@@ -213,25 +308,45 @@ def logtime(project=None):
     to the et_micc2 logger.
     
     This logs on debug level. To see in in the console output you must pass ``-vv`` to et_micc2.
-    
-    :param SimpleNameSpace global_options: pass verbosity to the et_micc2 logger.
+
+    At the end, the blocks timed by :py:func:`log` are summarized as a tree, slowest first.
+    If the option ``timing_json`` is set, they are also appended to that file as JSON lines.
+    The file is created even if no blocks were timed.
+
+    :param project: a Project object, or the options of a micc2 command (with a logger attribute).
     """
     if project is None:
         logfun = print
     else:
-        logfun = getattr(project.logger, 'debug', print)
+        logfun = getattr(getattr(project, 'logger', None), 'debug', print)
+    logger = getattr(logfun, '__self__', None)
+    is_logger = isinstance(logger, IndentingLogger)
+    if is_logger:
+        logger.spans.clear()
 
     start = datetime.now()
     logfun(f"start = {start}")
-    logfun.__self__.indent()
+    if is_logger:
+        logger.indent()
 
     yield
-    logfun.__self__.dedent()
+    if is_logger:
+        logger.dedent()
     stop = datetime.now()
     logfun(f"stop  = {stop}")
     spent = stop - start
     logfun(f"spent = {spent}")
 
+    if is_logger and logger.spans:
+        logfun("timing summary (slowest first):\n" + logger.span_summary())
+    options = getattr(project, 'context', project)
+    timing_json = getattr(options, 'timing_json', '')
+    if timing_json:
+        if is_logger:
+            logger.write_spans_json(timing_json)
+        else:
+            open(timing_json, 'a').close()
+
 
 def error(msg: str, exit_code=None):
     """Print an error message, and raise a RuntimeError if the exit_code is not None.
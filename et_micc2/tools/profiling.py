@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Module et_micc2.tools.profiling
+===============================
+
+Profiling of micc2 commands (``micc2 --profile <command>``).
+
+The time spent in the phases of a command (config load, project detection, TOML parse,
+template expansion, subprocess calls, git, serialization) is accumulated by wrapping the
+relevant code in :py:func:`phase`. Phases may be nested, the reported times are inclusive.
+When profiling is not enabled, :py:func:`phase` costs next to nothing.
+
+Optionally, a :py:mod:`cProfile` (pstats) file, or a file with collapsed stacks, which can
+be turned into a flame graph with e.g. ``flamegraph.pl`` or speedscope, is written.
+"""
+import collections
+import contextlib
+import functools
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# {phase name: [total time in seconds, number of calls]}
+timings = collections.defaultdict(lambda: [0.0, 0])
+_enabled = False
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Context manager accumulating the time spent in phase *name*, if profiling is enabled."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = timings[name]
+        timing[0] += time.perf_counter() - start
+        timing[1] += 1
+
+
+def timed(name):
+    """Decorator accumulating the time spent in the decorated function in phase *name*."""
+    def decorator(fun):
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fun(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _subprocess_phase(cmd):
+    """Return the phase of a subprocess command: 'git' for git and gh, 'subprocess' otherwise."""
+    if isinstance(cmd, (list, tuple)) and cmd:
+        exe = cmd[0]
+    else:
+        exe = str(cmd).split(' ', 1)[0]
+    return 'git' if os.path.basename(str(exe)) in ('git', 'gh') else 'subprocess'
+
+
+def _timed_subprocess(fun):
+    """Wrap a :py:mod:`subprocess` function to accumulate the time spent in its calls."""
+    @functools.wraps(fun)
+    def wrapper(*args, **kwargs):
+        cmd = args[0] if args else kwargs.get('args')
+        with phase(_subprocess_phase(cmd)):
+            return fun(*args, **kwargs)
+    wrapper.__wrapped_subprocess__ = fun
+    return wrapper
+
+
+_subprocess_functions = ('run', 'call', 'check_call', 'check_output')
+
+
+class StackSampler:
+    """Sample the call stack of a thread at regular intervals, and count the collapsed stacks.
+
+    :param float interval: sampling interval in seconds.
+    :param thread: the thread to sample, by default the main thread.
+    """
+    def __init__(self, interval=0.001, thread=None):
+        self.interval = interval
+        self.thread_id = (thread or threading.main_thread()).ident
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='micc2-stack-sampler', daemon=True)
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+    def start(self):
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+    def write(self, path):
+        """Write the collapsed stacks to *path*, one ``frame;frame;... count`` line per stack."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Profile a micc2 command.
+
+    :param str output: if not empty, the file to which the profile is written. If it ends with
+        ``.folded`` or ``.collapsed``, the collapsed stacks of a :py:class:`StackSampler` are
+        written, otherwise :py:mod:`cProfile` statistics, which can be read with :py:mod:`pstats`.
+    """
+    def __init__(self, output=''):
+        self.output = str(output) if output else ''
+        self.profile = None
+        self.sampler = None
+        self.start_time = None
+        self.elapsed = 0.0
+
+
+    @property
+    def collapsed(self):
+        return self.output.endswith(('.folded', '.collapsed'))
+
+
+    def start(self):
+        """Enable the phase timings, and start profiling."""
+        global _enabled
+        timings.clear()
+        _enabled = True
+        for name in _subprocess_functions:
+            setattr(subprocess, name, _timed_subprocess(getattr(subprocess, name)))
+        if self.output:
+            if self.collapsed:
+                self.sampler = StackSampler()
+                self.sampler.start()
+            else:
+                import cProfile
+                self.profile = cProfile.Profile()
+                self.profile.enable()
+        self.start_time = time.perf_counter()
+
+
+    def stop(self):
+        """Stop profiling, and write the profile, if requested."""
+        global _enabled
+        self.elapsed = time.perf_counter() - self.start_time
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.output)
+        if self.sampler:
+            self.sampler.stop()
+            self.sampler.write(self.output)
+        for name in _subprocess_functions:
+            fun = getattr(subprocess, name)
+            setattr(subprocess, name, getattr(fun, '__wrapped_subprocess__', fun))
+        _enabled = False
+
+
+    def report(self):
+        """Return the phase timings as a table, slowest phase first."""
+        lines = [ f"Profile ({self.elapsed:.3f}s in total, phases may be nested):"
+                , f"  {'phase':24} {'seconds':>9} {'calls':>6}"
+                ]
+        for name, (seconds, calls) in sorted(timings.items(), key=lambda item: -item[1][0]):
+            lines.append(f"  {name:24} {seconds:9.3f} {calls:6}")
+        if self.output:
+            lines.append(f"Profile written to {self.output}.")
+        return '\n'.join(lines)
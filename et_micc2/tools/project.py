@@ -29,9 +29,9 @@ from typing import List, Tuple
 # import et_micc2.tools.config as config
 # import et_micc2.tools.expand as expand
 import et_micc2.tools.messages as messages
+from   et_micc2.tools.profiling import phase, timed
 from   et_micc2.tools.tomlfile import TomlFile
 import et_micc2.tools.utils as utils
-from et_micc2.tools.components import ComponentDatabase
 
 
 __FILE__ = Path(__file__).resolve()
@@ -59,7 +59,10 @@ def is_project_directory(path: Path, project=None) -> bool:
     if not isinstance(path, Path):
         path = Path(path)
 
-    path_to_pyproject_toml = str(path / 'pyproject.toml')
+    path_to_pyproject_toml = path / 'pyproject.toml'
+    if not path_to_pyproject_toml.is_file():
+        # Avoid the cost of TomlFile for directories that are obviously not project directories
+        return False
 
     try:
         pyproject_toml = TomlFile(path_to_pyproject_toml)
@@ -72,6 +75,7 @@ def is_project_directory(path: Path, project=None) -> bool:
     return verify_project_structure(path, project)
 
 
+@timed('project detection')
 def get_project_path(p: Path) -> Path:
     """Look for a project directory in the parents of path :py:obj:`p`.
 
@@ -83,6 +87,9 @@ def get_project_path(p: Path) -> Path:
 
     Raises:
          RuntimeError if p` is not inside a project directory.
+
+    Directories without a :file:`pyproject.toml` file cost a single ``stat`` call
+    (see :py:func:`is_project_directory`).
     """
     root = Path('/')
     p = Path(p).resolve()
@@ -152,7 +159,9 @@ class Project:
             context.template_parameters = parameters
 
         self.logger = None
-        if is_project_directory(self.context.project_path, self):
+        with phase('project detection'):
+            is_project = is_project_directory(self.context.project_path, self)
+        if is_project:
             self.get_logger()
         else:
             # Not a project directory, only create and setup subcommands can work,
@@ -160,7 +169,36 @@ class Project:
             if not getattr(self.context, 'invoked_subcommand', '') in ('create',):
                 messages.error(f'Not a project directory: `{self.context.project_path}`')
 
-        self.components = ComponentDatabase(self.context.project_path)
+        # The components database is opened on first access, see self.components.
+        self._components = None
+
+
+    @property
+    def components(self):
+        """The project's components database, opened on first access.
+
+        Most commands (e.g. ``version``, ``info``, ``build``, ``doc``) never use it, and need
+        not read it.
+        """
+        if self._components is None:
+            from et_micc2.tools.components import open_component_database
+            # The components database backend ('json' or 'sqlite') can be chosen in the preferences:
+            preferences = getattr(self.context, 'preferences', None)
+            backend = getattr(preferences, 'data', {}).get('components_backend', 'json')
+            self._components = open_component_database(self.context.project_path, backend)
+        return self._components
+
+
+    def compact_components(self):
+        """Write the components journal, if any, to :file:`components.json`.
+
+        The journal is not under version control, hence this must precede git commits made by
+        micc2 (see :py:class:`~et_micc2.tools.components.ComponentDatabase`).
+        """
+        from et_micc2.tools.components import COMPONENTS_JOURNAL
+        if (self.context.project_path / COMPONENTS_JOURNAL).exists():
+            self.logger.info(f"Compacting {COMPONENTS_JOURNAL} into components.json before committing.")
+            self.components.compact()
 
 
     @property
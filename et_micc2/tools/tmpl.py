@@ -7,18 +7,65 @@ Package tmpl
 Top-level package for tmpl.
 """
 
+import codecs
+import concurrent.futures
 import os
 from pathlib import Path
 import re
 import shutil
+import time
+from types import SimpleNamespace
+
+
+# A template parameter in a template string, or in the path of a template file:
+_placeholder = re.compile(r'{{tmpl\.(\w+)}}')
+
+
+class Template:
+    """A template string, tokenized once into literal text and parameter names.
+
+    Expansion substitutes all parameters and verifies that none is missing in a single
+    pass over the tokens.
+
+    :param str s: the template string.
+    """
+    def __init__(self, s):
+        self.literals = [] # literal text preceding each parameter, and the text after the last one.
+        self.names = []    # the names of the parameters, in order of appearance.
+        pos = 0
+        for m in _placeholder.finditer(s):
+            self.literals.append(s[pos:m.start()])
+            self.names.append(m[1])
+            pos = m.end()
+        self.literals.append(s[pos:])
+
+
+    def expand(self, parameters):
+        """Return the template string with all parameters replaced by their value.
+
+        :param dict parameters: dictionary with the variables and their corresponding values.
+        :raise: ValueError if a parameter is missing.
+        """
+        if not self.names:
+            return self.literals[0]
+        parts = []
+        for literal, name in zip(self.literals, self.names):
+            parts.append(literal)
+            try:
+                parts.append(str(parameters[name]))
+            except KeyError:
+                raise ValueError(f"Missing parameter: '{name}'.")
+        parts.append(self.literals[-1])
+        return ''.join(parts)
 
 
 def expand_string(s, parameters):
-    for parameter,value in parameters.items():
-        pattern = '{{tmpl.' + parameter +'}}'
-        s = s.replace(pattern, str(value))
-    validate(s)
-    return s
+    """Replace all occurences of '{{tmpl.variable}}' in *s* with parameters[variable].
+
+    :raise: ValueError if a parameter is missing.
+    """
+    return Template(s).expand(parameters)
+
 
 def validate(s):
     """Verify that there are no more variables to be replaced.
@@ -26,12 +73,362 @@ def validate(s):
     :param str s: string to be validated
     :raise: ValueError if not fully expanded.
     """
-    pattern = r'{{tmpl\.(\w+)}}'
-    m = re.search(pattern, s)
+    m = _placeholder.search(s)
     if m:
         raise ValueError(f"Missing parameter: '{m[1]}'.")
 
 
+# Template files larger than this are not kept in memory, but streamed line by line.
+LARGE_FILE = 1 << 20
+# Number of bytes inspected to classify a large file as binary or text.
+_SAMPLE_SIZE = 8192
+
+
+def is_binary(data, final=True):
+    """Classify the contents of a template file as binary (True) or text (False).
+
+    :param bytes data: the contents of the file, or the first part of it.
+    :param bool final: False if *data* is only the first part of the file, which may end in
+        the middle of a multi-byte character.
+    """
+    if b'\0' in data:
+        return True
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(data, final=final)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def copy_file(src, dst, hardlink=False):
+    """Copy file *src* to *dst* without passing its contents through Python.
+
+    :param bool hardlink: create a hard link instead of a copy, if possible. Only use this if
+        neither *src* nor *dst* will be modified in place.
+    """
+    if hardlink:
+        try:
+            if dst.exists():
+                dst.unlink()
+            os.link(src, dst)
+            return
+        except OSError:
+            pass # e.g. different file systems: copy
+    shutil.copyfile(src, dst) # uses zero-copy system calls where available
+
+
+class TemplateFile:
+    """A template file, read, classified and tokenized once.
+
+    A template file is either
+
+    * a binary file, which is copied as is,
+    * a large text file (larger than :py:data:`LARGE_FILE` bytes), which is expanded line by
+      line while streaming it to the destination, or
+    * a text file, which is kept in memory, tokenized.
+
+    Text files without parameters are copied as is, too.
+
+    :param Path root: path to parent directory of the filepath to be expanded. The root is
+        excluded from the expansion.
+    :param Path path_to_template: location of of the template file
+    """
+    def __init__(self, root, path_to_template):
+        self.path = path_to_template
+        self.filepath = Template(str(path_to_template.relative_to(root)))
+        self.contents = None
+        self.streamed = path_to_template.stat().st_size > LARGE_FILE
+        if self.streamed:
+            with path_to_template.open('rb') as f:
+                self.binary = is_binary(f.read(_SAMPLE_SIZE), final=False)
+        else:
+            data = path_to_template.read_bytes()
+            self.binary = is_binary(data)
+            if not self.binary:
+                self.contents = Template(data.decode('utf-8'))
+
+
+    @property
+    def is_copied(self):
+        """True if the template file is copied, rather than expanded."""
+        return self.binary or (self.contents is not None and not self.contents.names)
+
+
+    def expand_path(self, parameters):
+        """Return the expanded path of the template file, relative to root."""
+        try:
+            return self.filepath.expand(parameters)
+        except ValueError as exc:
+            msg = exc.args[0] + f"\n    while expanding path of file {self.path}."
+            raise ValueError(msg)
+
+
+    def _lines(self):
+        """Iterate over the lines of a (large) text file, without translating line endings."""
+        with self.path.open('r', encoding='utf-8', newline='') as f:
+            yield from f
+
+
+    def validate_contents(self, parameters):
+        """Verify that the contents of the template file can be expanded with *parameters*.
+
+        :raise: ValueError if a parameter is missing.
+        """
+        if self.binary:
+            return
+        if self.streamed:
+            try:
+                names = [m[1] for line in self._lines() for m in _placeholder.finditer(line)]
+            except UnicodeDecodeError:
+                # A large file is classified from its first bytes only. It is not a text file
+                # after all (e.g. a data file with a text header): copy it as is.
+                self.binary = True
+                return
+        else:
+            names = self.contents.names
+        for name in names:
+            if not name in parameters:
+                raise ValueError(f"Missing parameter: '{name}'."
+                                 f"\n    while expanding contents of file {self.path}.")
+
+
+    def expand_contents(self, parameters):
+        """Return the expanded contents of the template file (bytes for a binary file)."""
+        if self.binary:
+            return self.path.read_bytes()
+        try:
+            if self.streamed:
+                return ''.join(Template(line).expand(parameters) for line in self._lines())
+            return self.contents.expand(parameters)
+        except ValueError as exc:
+            msg = exc.args[0] + f"\n    while expanding contents of file {self.path}."
+            raise ValueError(msg)
+
+
+    def write(self, dst, parameters, hardlink=False):
+        """Expand the contents of the template file and write them to *dst*.
+
+        The parent directory of *dst* must exist.
+
+        :param bool hardlink: hard link files that are copied as is, rather than copying them.
+        """
+        if self.is_copied:
+            copy_file(self.path, dst, hardlink=hardlink)
+        elif self.streamed:
+            try:
+                with dst.open('w', encoding='utf-8', newline='') as f:
+                    for line in self._lines():
+                        f.write(Template(line).expand(parameters))
+            except UnicodeDecodeError:
+                # Not a text file after all
+                copy_file(self.path, dst)
+            except ValueError as exc:
+                msg = exc.args[0] + f"\n    while expanding contents of file {self.path}."
+                raise ValueError(msg)
+        else:
+            dst.write_text(self.expand_contents(parameters), encoding='utf-8', newline='')
+
+
+    def expand(self, destination, parameters, hardlink=False):
+        """Expand the template file. Both path and contents are expanded.
+
+        :param Path destination: path to folder where the template file is to be expanded, with
+            its relative path to root.
+        :param dict parameters: dictionary with the variatbles and their corresponding values.
+        :param bool hardlink: hard link the file if it is copied as is, rather than copying it.
+        """
+        self.validate_contents(parameters) # report missing parameters in the contents first
+        dst = destination / self.expand_path(parameters)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        self.write(dst, parameters, hardlink=hardlink)
+
+
+class TemplateFolder:
+    """A template folder, walked, read and tokenized once.
+
+    The file list, the tokenized paths and contents, and the binary/text classification of
+    the template files are kept, so that the folder can be expanded repeatedly without
+    touching the template files again. Use :py:func:`compile_folder` to obtain a cached
+    TemplateFolder.
+
+    :param Path path_to_template_folder: location of the template folder.
+    """
+    def __init__(self, path_to_template_folder):
+        self.path = Path(path_to_template_folder)
+        self.dirs = []  # all directories in the template folder, including the folder itself.
+        self.files = [] # TemplateFile objects
+        pycaches = []
+        for d, dirs, files in os.walk(self.path):
+            if (d.endswith('__pycache__')):
+                ## pip install et-micc2 creates __pycache__ folders in the templates folder. we don't want that!
+                # skip them and remember them to remove them
+                pycaches.append(d)
+                continue
+            self.dirs.append(d)
+            for f in files:
+                if f != '.DS_Store':
+                    self.files.append(TemplateFile(self.path, Path(d) / f))
+
+        # Remove __pycache__ folders
+        for d in pycaches:
+            shutil.rmtree(d, ignore_errors=True)
+
+        self.stamp = self.get_stamp()
+
+
+    def get_stamp(self):
+        """Return the modification times of all directories and files in the template folder,
+        or None if one of them has disappeared.
+
+        Adding, removing or renaming a file modifies the mtime of its parent directory.
+        """
+        try:
+            return [os.stat(p).st_mtime_ns for p in self.dirs] \
+                 + [os.stat(f.path).st_mtime_ns for f in self.files]
+        except FileNotFoundError:
+            return None
+
+
+    def is_up_to_date(self):
+        """Verify that the template folder was not modified since it was compiled."""
+        return self.stamp is not None and self.get_stamp() == self.stamp
+
+
+    def expand(self, destination, parameters, max_workers=None, hardlink=False):
+        """Expand the template folder in *destination*.
+
+        All files are expanded and validated in memory first (see :py:class:`Plan`), so that
+        nothing is written if a parameter is missing. Then, the directory tree is created once
+        up front, and the files are written concurrently.
+
+        :param Path destination: path to folder where the template folder is to be expanded.
+        :param dict parameters: dictionary with the variatbles and their corresponding values.
+        :param max_workers: maximum number of threads writing files,
+            see :py:class:`concurrent.futures.ThreadPoolExecutor`.
+        :param bool hardlink: hard link files that are copied as is, rather than copying them.
+        """
+        plan = Plan()
+        plan.add_folder(self, destination, parameters)
+        plan.commit(max_workers=max_workers, hardlink=hardlink)
+
+
+class Plan:
+    """The expansion of one or more template folders, planned in memory.
+
+    Adding a template folder to a plan expands and validates all its paths and (text) contents,
+    without touching the destination. Only when the plan is committed, the files are written,
+    in one batch.
+    """
+    def __init__(self):
+        self.files = []    # list of SimpleNamespace(template_file, dst, parameters, contents, size)
+        self.elapsed = 0.0 # seconds spent planning
+
+
+    def add_folder(self, template_folder, destination, parameters):
+        """Plan the expansion of a template folder.
+
+        :param template_folder: a :py:class:`TemplateFolder`, or the location of a template folder.
+        :param Path destination: path to folder where the template folder is to be expanded.
+        :param dict parameters: dictionary with the variatbles and their corresponding values.
+        :raise: ValueError if a parameter is missing. Nothing is added to the plan in that case.
+        """
+        start = time.perf_counter()
+        if not isinstance(template_folder, TemplateFolder):
+            template_folder = compile_folder(template_folder)
+        files = []
+        for template_file in template_folder.files:
+            try:
+                dst = destination / template_file.expand_path(parameters)
+                contents = None
+                if template_file.is_copied:
+                    size = template_file.path.stat().st_size
+                elif template_file.streamed:
+                    template_file.validate_contents(parameters)
+                    size = template_file.path.stat().st_size # approximately
+                else:
+                    contents = template_file.expand_contents(parameters)
+                    size = len(contents.encode('utf-8'))
+            except ValueError as exc:
+                msg = exc.args[0] + f'\n    while expanding template folder {template_folder.path}.'
+                raise ValueError(msg)
+            files.append(SimpleNamespace(template_file=template_file, dst=dst, parameters=parameters
+                                        , contents=contents, size=size))
+        self.files.extend(files)
+        self.elapsed += time.perf_counter() - start
+
+
+    @property
+    def n_bytes(self):
+        """The number of bytes to be written."""
+        return sum(f.size for f in self.files)
+
+
+    def status(self, planned_file):
+        """Return 'new', 'modified' or 'unchanged', comparing a planned file to the destination.
+
+        Only files expanded in memory can be 'unchanged'.
+        """
+        if not planned_file.dst.exists():
+            return 'new'
+        if planned_file.contents is not None:
+            try:
+                if planned_file.dst.read_text(encoding='utf-8') == planned_file.contents:
+                    return 'unchanged'
+            except (OSError, UnicodeDecodeError):
+                pass
+        return 'modified'
+
+
+    def report(self, verbose=False):
+        """Return a summary of the plan, and, if *verbose*, the status of every file."""
+        lines = [f"{len(self.files)} files, {self.n_bytes} bytes, planned in {self.elapsed:.3f}s."]
+        if verbose:
+            for planned_file in self.files:
+                lines.append(f"  {self.status(planned_file):9} {planned_file.dst} ({planned_file.size} bytes)")
+        return '\n'.join(lines)
+
+
+    def commit(self, max_workers=None, hardlink=False):
+        """Write all planned files.
+
+        The directory tree is created once up front, then the files are written concurrently.
+
+        :param max_workers: maximum number of threads writing files,
+            see :py:class:`concurrent.futures.ThreadPoolExecutor`.
+        :param bool hardlink: hard link files that are copied as is, rather than copying them.
+        """
+        for d in sorted({planned_file.dst.parent for planned_file in self.files}):
+            d.mkdir(parents=True, exist_ok=True)
+
+        def write(planned_file):
+            if planned_file.contents is None:
+                planned_file.template_file.write(planned_file.dst, planned_file.parameters, hardlink)
+            else:
+                planned_file.dst.write_text(planned_file.contents, encoding='utf-8', newline='')
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # list() re-raises the first exception, in the order of the files
+            list(executor.map(write, self.files))
+
+
+# cache of compiled template folders: {resolved path: TemplateFolder}
+_template_folders = {}
+
+
+def compile_folder(path_to_template_folder):
+    """Return the TemplateFolder for *path_to_template_folder*.
+
+    Compiled template folders are cached for the lifetime of the process, and recompiled if
+    any of their directories or files was modified.
+    """
+    key = str(Path(path_to_template_folder).resolve())
+    template_folder = _template_folders.get(key)
+    if template_folder is None or not template_folder.is_up_to_date():
+        template_folder = TemplateFolder(path_to_template_folder)
+        _template_folders[key] = template_folder
+    return template_folder
+
+
 def expand_file(root, path_to_template, destination, parameters):
     """Expand a single template file. Both path and contents are expanded.
 
@@ -44,29 +441,10 @@ def expand_file(root, path_to_template, destination, parameters):
         All occurences of '{{tmpl.variable}}' in the template file and its filename are
         replaced with parameters[variable].
     """
-    # Expand the file contents
-    template = path_to_template.read_text()
-    try:
-        template = expand_string(template, parameters)
-    except ValueError as exc:
-        msg = exc.args[0] + f"\n    while expanding contents of file {path_to_template}."
-        raise ValueError(msg)
-
-    # expand the file path
-    filepath = str(path_to_template.relative_to(root))
-    try:
-        filepath = expand_string(filepath, parameters)
-    except ValueError as exc:
-        msg = exc.args[0] + f"\n    while expanding path of file {path_to_template}."
-        raise ValueError(msg)
-
-    # Write the result
-    dst = destination / filepath
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    dst.write_text(template)
+    TemplateFile(root, path_to_template).expand(destination, parameters)
 
 
-def expand_folder(path_to_template_folder, destination, parameters):
+def expand_folder(path_to_template_folder, destination, parameters, max_workers=None, hardlink=False):
     """Expand a template folder.
 
     :param Path path_to_template_folder: location of the template folder. Only the contents
@@ -77,24 +455,8 @@ def expand_folder(path_to_template_folder, destination, parameters):
     :param dict parameters: dictionary with the variatbles and their corresponding values.
         All occurences of '{{tmpl.variable}}' in the template file and its filename are
         replaced with parameters[variable].
+    :param max_workers: maximum number of threads writing files.
+    :param bool hardlink: hard link binary files and text files without parameters, rather
+        than copying them. Only use this if the expanded files will not be modified in place.
     """
-    root = path_to_template_folder
-    pycaches = []
-    for d, dirs, files in os.walk(path_to_template_folder):
-        # print('@@',d,dirs,files)
-        if (d.endswith('__pycache__')):
-            ## pip install et-micc2 creates __pycache__ folders in the templates folder. we don't want that!
-            # skip them and remember them to remove them
-            pycaches.append(d) 
-            continue
-        for f in files:
-            if f != '.DS_Store':
-                try:
-                    expand_file(root, Path(d) / f, destination, parameters)
-                except ValueError as exc:
-                    msg = exc.args[0] + f'\n    while expanding template folder {path_to_template_folder}.'
-                    raise ValueError(msg)
-    
-    # Remove __pycache__ folders
-    for d in pycaches:
-        shutil.rmtree(d, ignore_errors=True)
\ No newline at end of file
+    compile_folder(path_to_template_folder).expand(destination, parameters, max_workers=max_workers, hardlink=hardlink)
@@ -11,6 +11,8 @@ from typing import Union
 # from ._compat import Path
 from pathlib import Path
 
+from et_micc2.tools.profiling import phase
+
 
 class TomlFile(BaseTOMLFile):
     """Read/write access to :file:`.toml` files (:file:`pyproject.toml` in particular).
@@ -37,7 +39,8 @@ class TomlFile(BaseTOMLFile):
 
         self._path_ = Path(path)
         if self.exists():
-            self._content_ = self.read()
+            with phase('TOML parse'):
+                self._content_ = self.read()
         else:
             raise FileNotFoundError(str(self._path_))
 
@@ -68,6 +71,7 @@ class TomlFile(BaseTOMLFile):
 
     def save(self):
         """Write the current content of the :file:`.toml` file back to file."""
-        self.write(self._content_)\
+        with phase('serialization'):
+            self.write(self._content_)\
         
 # eof
\ No newline at end of file
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Module et_micc2.tools.toolchain
+===============================
+
+Discovery of the toolchain for building binary extensions:
+
+* the binary extension suffix of the Python interpreter (``EXT_SUFFIX``),
+* the location of pybind11's CMake tools,
+* the f2py executable and the numpy and f2py include directories,
+* the compilers and their versions.
+
+Discovery is expensive (scanning site-packages, importing numpy, running compilers), so
+the results are cached per Python interpreter in :file:`~/.micc2/toolchain-<id>.json`. The
+cache is invalidated when the interpreter, or any of its site-packages directories, is
+modified (e.g. by installing or removing a package), and when the environment variables
+that determine which compilers and executables are found (``PATH``, ``CC``, ``CXX``, ``FC``)
+change (e.g. by a ``module load`` on a cluster). The cache file is plain JSON, so the
+discovery results can be inspected there.
+"""
+import functools
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import site
+import subprocess
+import sys
+import sysconfig
+
+import et_micc2.tools.utils as utils
+
+CACHE_DIR = Path.home() / '.micc2'
+
+# The environment variables that the discovered compilers and executables depend on.
+ENVIRONMENT_VARIABLES = ('PATH', 'CC', 'CXX', 'FC')
+
+
+def cache_file() -> Path:
+    """Return the path to the toolchain cache file of the current Python interpreter."""
+    interpreter_id = hashlib.sha1(sys.executable.encode()).hexdigest()[:12]
+    return CACHE_DIR / f'toolchain-{interpreter_id}.json'
+
+
+def site_packages() -> list:
+    """Return the global and user site-packages directories."""
+    result = site.getsitepackages()
+    result.append(site.getusersitepackages())
+    return result
+
+
+def interpreter_stamp() -> dict:
+    """Return the data identifying the current state of the Python interpreter and of the
+    environment variables in :py:data:`ENVIRONMENT_VARIABLES`.
+    """
+    stamp = { 'executable' : sys.executable
+            , 'version'    : sys.version
+            , 'environment': {var: os.environ.get(var, '') for var in ENVIRONMENT_VARIABLES}
+            , 'mtimes'     : {}
+            }
+    for p in [sys.executable, *site_packages()]:
+        try:
+            stamp['mtimes'][p] = os.stat(p).st_mtime_ns
+        except OSError:
+            pass
+    return stamp
+
+
+def find_pybind11_cmake_dir() -> str:
+    """Return the path to pybind11's CMake tools, or an empty string if pybind11 is not found."""
+    for d in site_packages():
+        p = Path(d) / 'pybind11' / 'share' / 'cmake' / 'pybind11'
+        if p.is_dir():
+            return str(p)
+    return ''
+
+
+def numpy_include_dirs() -> dict:
+    """Return the numpy and f2py include directories, or empty strings if numpy is not found."""
+    try:
+        import numpy
+        import numpy.f2py
+    except ImportError:
+        return {'numpy_include': '', 'f2py_include': ''}
+    return { 'numpy_include': numpy.get_include()
+           , 'f2py_include' : numpy.f2py.get_include() if hasattr(numpy.f2py, 'get_include') else ''
+           }
+
+
+def compiler_versions() -> dict:
+    """Return the location and version of the compilers that CMake will pick up."""
+    result = {}
+    for var, default in (('CC', 'cc'), ('CXX', 'c++'), ('FC', 'gfortran')):
+        exe = os.environ.get(var, default)
+        which = shutil.which(exe)
+        if which:
+            completed = subprocess.run([which, '--version'], capture_output=True, text=True)
+            version = completed.stdout.strip().split('\n')[0] if completed.returncode == 0 else ''
+        else:
+            version = ''
+        result[var] = {'exe': exe, 'which': which or '', 'version': version}
+    return result
+
+
+def discover() -> dict:
+    """Discover the toolchain (without using the cache)."""
+    toolchain = { 'ext_suffix'        : sysconfig.get_config_var('EXT_SUFFIX')
+                , 'pybind11_cmake_dir': find_pybind11_cmake_dir()
+                , 'f2py'              : shutil.which('f2py') or ''
+                , 'compilers'         : compiler_versions()
+                }
+    toolchain.update(numpy_include_dirs())
+    return toolchain
+
+
+def _is_valid(cached: dict, stamp: dict) -> bool:
+    """Verify that the cached toolchain was discovered for the current interpreter state,
+    and that the directories it refers to still exist.
+    """
+    if cached.get('stamp') != stamp:
+        return False
+    toolchain = cached.get('toolchain', {})
+    for key in ('pybind11_cmake_dir', 'f2py', 'numpy_include'):
+        if toolchain.get(key) and not os.path.exists(toolchain[key]):
+            return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def get_toolchain() -> dict:
+    """Return the toolchain of the current Python interpreter.
+
+    The result is cached on disk, and in memory for the lifetime of the process.
+    """
+    stamp = interpreter_stamp()
+    p = cache_file()
+    try:
+        with p.open() as f:
+            cached = json.load(f)
+        if _is_valid(cached, stamp):
+            return cached['toolchain']
+    except (OSError, ValueError):
+        pass
+
+    toolchain = discover()
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        with utils.atomic_replace(p) as tmp:
+            with tmp.open('w') as f:
+                json.dump({'stamp': stamp, 'toolchain': toolchain}, f, indent=2)
+    except OSError:
+        pass # not being able to cache is not fatal
+    return toolchain
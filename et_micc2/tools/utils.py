@@ -19,8 +19,6 @@ import subprocess
 import sys
 import time
 
-from pypi_simple import PyPISimple
-
 import et_micc2.tools.messages as messages
 
 def operator_version(version_constraint_string):
@@ -175,6 +173,8 @@ def existsOnPyPI(package):
 
     In case of an exception, the result is inconclusive.
     """
+    # pypi_simple (and requests) are expensive to import, and only needed here.
+    from pypi_simple import PyPISimple
     try:
         with PyPISimple() as client:
             requests_page = client.get_project_page(package)
@@ -249,6 +249,36 @@ def in_directory(path):
         os.chdir(previous_dir)
 
 
+@contextmanager
+def atomic_replace(path):
+    """Context manager for replacing file *path* atomically.
+
+    The body of the context manager writes the new file to the temporary path it is given,
+    next to *path*. When the body completes, the temporary file is renamed to *path*, which
+    is atomic: readers see either the old or the new file, never a partially written one.
+    If the body raises an exception, the temporary file is removed and *path* is untouched.
+
+    .. code-block:: python
+
+       with atomic_replace(path) as tmp:
+           with tmp.open('w') as f:
+               json.dump(data, f)
+
+    :param Path path: the file to replace.
+    """
+    path = Path(path)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+
 def execute(cmds,logfun=None,stop_on_error=True,env=None,cwd=None,verbose=True):
     """Executes a list of OS commands, and logs with logfun.
     
@@ -0,0 +1,544 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the build subcommand."""
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import et_micc2.subcmds._build as build
+import et_micc2.tools.autobuild as autobuild
+import et_micc2.tools.buildcache as buildcache
+import et_micc2.tools.messages as messages
+from et_micc2.tools.filelock import FileLock, FileLockTimeout
+
+
+def build_options_for(project_path, name='foo'):
+    """Create a fake binary extension module in project_path and return its build options."""
+    srcdir = project_path / 'pkg' / name
+    (srcdir / '_cmake_build').mkdir(parents=True)
+    (srcdir / 'CMakeLists.txt').write_text('project(foo CXX)\n')
+    (srcdir / f'{name}.cpp').write_text('// foo\n')
+    (srcdir / '_cmake_build' / 'CMakeCache.txt').write_text('build artefact\n')
+    (srcdir / 'micc-build.log').write_text('log\n')
+    return SimpleNamespace(
+        submodule_srcdir_path=srcdir,
+        submodule_binary=project_path / 'pkg' / f'{name}.so',
+        submodule_type='cpp',
+        cmake={},
+    )
+
+
+def fake_project(project_path, names, jobs=1):
+    """Create a fake project with a C++ binary extension module for each name in names."""
+    package_path = project_path / 'pkg'
+    for name in names:
+        srcdir = package_path / name
+        srcdir.mkdir(parents=True)
+        (srcdir / 'CMakeLists.txt').write_text(f'project({name} CXX)\n')
+        (srcdir / f'{name}.cpp').write_text(f'// {name}\n')
+    logger = SimpleNamespace(infos=[], errors=[], spans=[])
+    logger.info = logger.infos.append
+    logger.error = logger.errors.append
+    logger.add_spans = logger.spans.extend
+    build_options = SimpleNamespace(
+        module_to_build='', clean=False, cleanup=False, jobs=jobs, cmake={}, generator='make'
+    )
+    context = SimpleNamespace(project_path=project_path, package_name='pkg', build_options=build_options)
+    return SimpleNamespace(context=context, logger=logger)
+
+
+def test_build_scheduling(tmp_path, monkeypatch):
+    import concurrent.futures
+    import threading
+
+    calls = []
+    lock = threading.Lock()
+
+    def fake_build_binary_extension(context, report=None):
+        build_options = context.build_options
+        with lock:
+            calls.append((build_options.submodule_name, build_options.parallel_level, build_options.console))
+        if build_options.submodule_name == 'bad':
+            return 2
+        build_options.submodule_binary.write_bytes(b'binary')
+        return 0
+
+    monkeypatch.setattr(build, 'build_binary_extension', fake_build_binary_extension)
+    # Threads rather than processes, to collect the calls:
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', concurrent.futures.ThreadPoolExecutor)
+    monkeypatch.setattr(build.env, 'check_cmake', lambda required=False: None)
+    monkeypatch.setattr(build.env, 'check_pybind11', lambda required=False: None)
+
+    # 8 jobs over 3 extensions: 3 worker processes, each running make -j2
+    project = fake_project(tmp_path, ['foo', 'bar', 'bad'], jobs=8)
+    build.build(project)
+    assert sorted(calls) == [('bad', 2, False), ('bar', 2, False), ('foo', 2, False)]
+    suffix = build.get_extension_suffix()
+    assert (tmp_path / 'pkg' / f'foo{suffix}').exists()
+    assert (tmp_path / 'pkg' / f'bar{suffix}').exists()
+    errors = '\n'.join(project.logger.errors)
+    assert f"bad{suffix} (exit code 2, see {tmp_path / 'pkg' / 'bad' / 'micc-build.log'})" in errors
+    assert 'foo' not in errors and 'bar' not in errors
+    infos = '\n'.join(project.logger.infos)
+    assert f"foo{suffix}" in infos and f"bar{suffix}" in infos
+    assert "using 3 processes (make -j2)" in infos
+    report = json.loads((tmp_path / build.BUILD_REPORT).read_text())
+    assert {e['name']: e['exit_code'] for e in report['extensions']} == {'foo': 0, 'bar': 0, 'bad': 2}
+
+    # A single job: no worker processes, build output to the console.
+    # foo and bar are up to date, only bad is rebuilt.
+    calls.clear()
+    project.context.build_options.jobs = 1
+    build.build(project)
+    assert calls == [('bad', 1, True)]
+    assert f"foo{suffix}" in '\n'.join(project.logger.infos[-5:])
+
+    # 2 jobs over 3 extensions: 2 worker processes, each running make -j1
+    calls.clear()
+    project.context.build_options.jobs = 2
+    project.context.build_options.clean = True
+    project.context.build_options.generator = 'ninja'
+    build.build(project)
+    assert sorted(calls) == [('bad', 1, False), ('bar', 1, False), ('foo', 1, False)]
+    assert "using 2 processes (ninja -j1)" in "\n".join(project.logger.infos)
+
+
+def test_build_timing(tmp_path, monkeypatch):
+    import pickle
+
+    def execute(cmd, logfun=None, stop_on_error=True, env=None, cwd=None, verbose=True):
+        if cmd[-1] == 'install':
+            name = Path(env['DESTDIR']).parent.parent.name
+            staged = Path(env['DESTDIR']) / 'pkg' / f'{name}{build.get_extension_suffix()}'
+            staged.parent.mkdir(parents=True)
+            staged.write_bytes(b'binary')
+        return 0
+    monkeypatch.setattr(build.utils, 'execute', execute)
+    monkeypatch.setattr(build, 'path_to_cmake_tools', lambda: '')
+    monkeypatch.setattr(build.env, 'check_cmake', lambda required=False: None)
+    monkeypatch.setattr(build.env, 'check_pybind11', lambda required=False: None)
+
+    project = fake_project(tmp_path, ['foo', 'bar'])
+    project.logger = messages.create_logger(tmp_path / 'micc.log', console=False)
+    project.context.logger = project.logger
+    project.context.timing_json = tmp_path / 'timing.jsonl'
+    with messages.logtime(project.context):
+        build.build(project)
+    records = [json.loads(line) for line in project.context.timing_json.read_text().splitlines()]
+    roots = sorted(record['name'] for record in records if record['depth'] == 0)
+    assert roots == ["Building cpp module 'pkg/bar':", "Building cpp module 'pkg/foo':"]
+    assert all(record['duration'] is not None for record in records)
+    # The spans of parallel builds are returned by the worker processes:
+    assert len(pickle.loads(pickle.dumps(project.logger.spans))) == 2
+
+    # Nothing to build, nothing timed, but the file is created anyway:
+    project.context.timing_json = tmp_path / 'up-to-date.jsonl'
+    with messages.logtime(project.context):
+        build.build(project)
+    assert project.context.timing_json.read_text() == ''
+    messages.close_logger(project.logger)
+
+
+def test_source_files(tmp_path):
+    build_options = build_options_for(tmp_path)
+    files = buildcache.source_files(build_options.submodule_srcdir_path)
+    assert files == [Path('CMakeLists.txt'), Path('foo.cpp')]
+
+
+def test_fingerprint(tmp_path):
+    build_options = build_options_for(tmp_path)
+    fp = buildcache.fingerprint(build_options)
+    # build artefacts do not affect the fingerprint
+    (build_options.submodule_srcdir_path / 'micc-build.log').write_text('another log\n')
+    assert buildcache.fingerprint(build_options) == fp
+    # sources do
+    (build_options.submodule_srcdir_path / 'foo.cpp').write_text('// modified\n')
+    assert buildcache.fingerprint(build_options) != fp
+    # and so do the build settings
+    fp = buildcache.fingerprint(build_options)
+    build_options.cmake['CMAKE_BUILD_TYPE'] = 'Debug'
+    assert buildcache.fingerprint(build_options) != fp
+
+
+def test_build_cache(tmp_path):
+    build_options = build_options_for(tmp_path)
+    fp = buildcache.fingerprint(build_options)
+    cache = buildcache.BuildCache(tmp_path)
+    assert not cache.is_up_to_date(build_options, fp)
+
+    build_options.submodule_binary.write_bytes(b'binary')
+    cache.update(build_options, fp)
+    cache.serialize()
+    cache = buildcache.BuildCache(tmp_path)
+    assert cache.is_up_to_date(build_options, fp)
+    assert not cache.is_up_to_date(build_options, 'other fingerprint')
+
+    # a binary that was replaced by something else is not up to date
+    build_options.submodule_binary.write_bytes(b'another binary')
+    assert not cache.is_up_to_date(build_options, fp)
+
+    cache.invalidate(build_options)
+    assert not cache.db
+
+
+def test_build_cache_dependencies(tmp_path):
+    build_options = build_options_for(tmp_path)
+    srcdir = build_options.submodule_srcdir_path
+    header = tmp_path / 'include' / 'ext.h'
+    header.parent.mkdir()
+    header.write_text('// ext\n')
+    library = tmp_path / 'lib' / 'libext.a'
+    library.parent.mkdir()
+    library.write_bytes(b'lib')
+    build_dir = srcdir / '_cmake_build'
+    (build_dir / 'CMakeFiles' / 'foo.dir').mkdir(parents=True)
+    (build_dir / 'CMakeFiles' / 'foo.dir' / 'foo.cpp.o.d').write_text(
+        f"CMakeFiles/foo.dir/foo.cpp.o: {srcdir / 'foo.cpp'} \\\n"
+        f" {header}\n"
+    )
+    (build_dir / 'CMakeFiles' / 'foo.dir' / 'link.txt').write_text(
+        f"/usr/bin/c++ -shared -o foo.so CMakeFiles/foo.dir/foo.cpp.o {library}\n"
+    )
+    assert set(buildcache.dependencies(build_options)) == {str(header), str(library)}
+
+    fp = buildcache.fingerprint(build_options)
+    build_options.submodule_binary.write_bytes(b'binary')
+    cache = buildcache.BuildCache(tmp_path)
+    cache.update(build_options, fp)
+    assert cache.is_up_to_date(build_options, fp)
+    # the header is outside the source directory, and does not affect the fingerprint,
+    # but the binary extension is no longer up to date
+    header.write_text('// modified ext\n')
+    assert buildcache.fingerprint(build_options) == fp
+    assert not cache.is_up_to_date(build_options, fp)
+    cache.update(build_options, fp)
+    assert cache.is_up_to_date(build_options, fp)
+    library.write_bytes(b'modified lib')
+    assert not cache.is_up_to_date(build_options, fp)
+
+
+def test_cmake_generator():
+    assert build.cmake_generator('ninja') == ('Ninja', 'ninja')
+    generator, make = build.cmake_generator('make')
+    assert make in ('make', 'nmake')
+    assert build.resolve_generator('auto') in ('ninja', 'make')
+
+
+def test_read_cmake_cache(tmp_path):
+    assert build.read_cmake_cache(tmp_path) == {}
+    (tmp_path / 'CMakeCache.txt').write_text(
+        "# This is the CMakeCache file.\n"
+        "//Path to a program.\n"
+        "PYTHON_EXECUTABLE:FILEPATH=/usr/bin/python3\n"
+        "\n"
+        "CMAKE_GENERATOR:INTERNAL=Ninja\n"
+        "CMAKE_CXX_FLAGS:STRING=-O2 -DFOO=1\n"
+    )
+    entries = build.read_cmake_cache(tmp_path)
+    assert entries['PYTHON_EXECUTABLE'] == '/usr/bin/python3'
+    assert entries['CMAKE_GENERATOR'] == 'Ninja'
+    assert entries['CMAKE_CXX_FLAGS'] == '-O2 -DFOO=1'
+
+
+def test_is_configured(tmp_path):
+    build_dir = tmp_path / '_cmake_build'
+    build_dir.mkdir()
+    defines = {'PYTHON_EXECUTABLE': '/usr/bin/python3', 'CMAKE_BUILD_TYPE': 'Release'}
+    (build_dir / 'CMakeCache.txt').write_text(
+        f"CMAKE_GENERATOR:INTERNAL=Unix Makefiles\n"
+        f"CMAKE_HOME_DIRECTORY:INTERNAL={tmp_path}\n"
+        f"PYTHON_EXECUTABLE:FILEPATH=/usr/bin/python3\n"
+        f"CMAKE_BUILD_TYPE:STRING=Release\n"
+    )
+    cmake_cache = build.read_cmake_cache(build_dir)
+    # configure step did not generate the build system
+    assert not build.is_configured(build_dir, cmake_cache, 'Unix Makefiles', defines)
+    (build_dir / 'Makefile').write_text('')
+    assert build.is_configured(build_dir, cmake_cache, 'Unix Makefiles', defines)
+    assert not build.is_configured(build_dir, cmake_cache, 'Ninja', defines)
+    assert not build.is_configured(build_dir, cmake_cache, 'Unix Makefiles', dict(defines, CMAKE_BUILD_TYPE='Debug'))
+    assert not build.is_configured(build_dir, {}, 'Unix Makefiles', defines)
+
+
+def test_install_binary(tmp_path, monkeypatch):
+    import os
+    staged = tmp_path / 'staging' / 'foo.so'
+    staged.parent.mkdir()
+    staged.write_bytes(b'new binary')
+    destination = tmp_path / 'foo.so'
+    destination.write_bytes(b'old binary')
+    old_inode = destination.stat().st_ino
+
+    replaced = []
+    os_replace = os.replace
+    def replace(src, dst):
+        replaced.append((Path(src).name, Path(dst)))
+        os_replace(src, dst)
+    monkeypatch.setattr(os, 'replace', replace)
+
+    build.install_binary(staged, destination)
+    assert replaced == [(f'.foo.so.{os.getpid()}.tmp', destination)]
+    assert destination.read_bytes() == b'new binary'
+    # the destination is replaced, not overwritten, so processes that loaded the old binary are unaffected
+    assert destination.stat().st_ino != old_inode
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['foo.so', 'staging']
+
+
+def fake_build_context(project_path):
+    """Return the build context for binary extension module pkg/foo in project_path."""
+    build_options = build_options_for(project_path)
+    build_options.submodule_name = 'foo'
+    build_options.clean = False
+    build_options.cleanup = False
+    build_options.generator = 'ninja'
+    build_options.compiler_launcher = ''
+    build_options.parallel_level = 1
+    build_options.console = False
+    return SimpleNamespace(project_path=project_path, build_options=build_options)
+
+
+@pytest.mark.parametrize('failing_step', ['cmake', 'ninja', 'install'])
+def test_failing_build_keeps_binary(tmp_path, monkeypatch, failing_step):
+    context = fake_build_context(tmp_path)
+    destination = context.build_options.submodule_binary
+    destination.write_bytes(b'old binary')
+
+    def execute(cmd, logfun=None, stop_on_error=True, env=None, cwd=None, verbose=True):
+        step = 'install' if cmd[-1] == 'install' else cmd[0]
+        if step == failing_step:
+            return 2
+        if step == 'install':
+            # a partially installed binary
+            staged = Path(env['DESTDIR']) / 'pkg' / destination.name
+            staged.parent.mkdir(parents=True)
+            staged.write_bytes(b'broken binary')
+        return 0
+    monkeypatch.setattr(build.utils, 'execute', execute)
+    monkeypatch.setattr(build, 'path_to_cmake_tools', lambda: '')
+
+    assert build.build_binary_extension(context) == 2
+    assert destination.read_bytes() == b'old binary'
+    assert sorted(p.name for p in destination.parent.iterdir()) == ['foo', 'foo.so']
+    assert not (context.build_options.submodule_srcdir_path / '_cmake_build' / '_staging').exists()
+
+
+def test_build_closes_log_file(tmp_path, monkeypatch):
+    context = fake_build_context(tmp_path)
+    loggers = []
+    create_logger = build.messages.create_logger
+    def create_logger_(*args, **kwargs):
+        loggers.append(create_logger(*args, **kwargs))
+        return loggers[-1]
+    monkeypatch.setattr(build.messages, 'create_logger', create_logger_)
+
+    def execute(cmd, logfun=None, stop_on_error=True, env=None, cwd=None, verbose=True):
+        raise OSError('cmake crashed')
+    monkeypatch.setattr(build.utils, 'execute', execute)
+    monkeypatch.setattr(build, 'path_to_cmake_tools', lambda: '')
+    with pytest.raises(OSError):
+        build.build_binary_extension(context)
+    assert not loggers[-1].handlers
+
+    context.build_options.submodule_type = 'py'
+    with pytest.raises(RuntimeError):
+        build.build_binary_extension(context)
+    assert not loggers[-1].handlers
+
+
+def test_successful_build_replaces_binary(tmp_path, monkeypatch):
+    context = fake_build_context(tmp_path)
+    destination = context.build_options.submodule_binary
+    destination.write_bytes(b'old binary')
+
+    def execute(cmd, logfun=None, stop_on_error=True, env=None, cwd=None, verbose=True):
+        if cmd[-1] == 'install':
+            staged = Path(env['DESTDIR']) / 'pkg' / destination.name
+            staged.parent.mkdir(parents=True)
+            staged.write_bytes(b'new binary')
+        return 0
+    monkeypatch.setattr(build.utils, 'execute', execute)
+    monkeypatch.setattr(build, 'path_to_cmake_tools', lambda: '')
+
+    report = build.extension_report(destination, 'cpp')
+    assert build.build_binary_extension(context, report) == 0
+    assert destination.read_bytes() == b'new binary'
+    assert sorted(p.name for p in destination.parent.iterdir()) == ['foo', 'foo.so']
+    assert not (context.build_options.submodule_srcdir_path / '_cmake_build' / '_staging').exists()
+    assert report['status'] == 'built' and report['binary_size'] == len(b'new binary')
+
+
+def test_cleanup_keeps_build_cache_dependencies(tmp_path, monkeypatch):
+    context = fake_build_context(tmp_path)
+    build_options = context.build_options
+    build_options.cleanup = True
+    build_options.fingerprint = buildcache.fingerprint(build_options)
+    destination = build_options.submodule_binary
+    build_dir = build_options.submodule_srcdir_path / '_cmake_build'
+    header = tmp_path / 'include' / 'ext.h'
+    header.parent.mkdir()
+    header.write_text('// ext\n')
+
+    def execute(cmd, logfun=None, stop_on_error=True, env=None, cwd=None, verbose=True):
+        if cmd[-1] == 'install':
+            staged = Path(env['DESTDIR']) / 'pkg' / destination.name
+            staged.parent.mkdir(parents=True)
+            staged.write_bytes(b'new binary')
+        else:
+            (build_dir / 'foo.cpp.o.d').write_text(f"foo.cpp.o: {header}\n")
+        return 0
+    monkeypatch.setattr(build.utils, 'execute', execute)
+    monkeypatch.setattr(build, 'path_to_cmake_tools', lambda: '')
+
+    assert build._build_worker(context).exit_code == 0
+    assert not build_dir.exists()
+    cache = buildcache.BuildCache(tmp_path)
+    assert list(cache.db['pkg/foo']['dependencies']) == [str(header)]
+    assert cache.is_up_to_date(build_options, build_options.fingerprint)
+    header.write_text('// modified ext\n')
+    assert not cache.is_up_to_date(build_options, build_options.fingerprint)
+
+
+def test_build_missing_existing_binary(tmp_path):
+    # Not a project, so this would fail if it attempted to build.
+    package = tmp_path / 'pkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / f'foo{autobuild._extension_suffix}').write_bytes(b'binary')
+    autobuild.build_missing(str(package / '__init__.py'), 'foo')
+    assert sorted(p.name for p in package.iterdir()) == ['__init__.py', f'foo{autobuild._extension_suffix}']
+
+
+def fake_package(tmp_path):
+    """Create a package without binary extension, and return the path to its __init__.py and binary."""
+    package = tmp_path / 'pkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    return package / '__init__.py', package / f'foo{autobuild._extension_suffix}'
+
+
+def test_build_missing_wait_for_other_process(tmp_path, monkeypatch):
+    import subprocess
+    import threading
+
+    init, binary = fake_package(tmp_path)
+    runs = []
+    monkeypatch.setattr(subprocess, 'run', lambda *args, **kwargs: runs.append(args))
+
+    # Another process is building the binary extension:
+    lock = FileLock(autobuild.build_lock_path(str(binary))).acquire()
+    def finish_build():
+        binary.write_bytes(b'binary')
+        lock.release()
+    timer = threading.Timer(0.3, finish_build)
+    timer.start()
+    autobuild.build_missing(str(init), 'foo')
+    timer.join()
+    assert binary.exists()
+    assert not runs
+
+
+def test_build_missing_lock_timeout(tmp_path, monkeypatch):
+    import subprocess
+
+    init, binary = fake_package(tmp_path)
+    runs = []
+    monkeypatch.setattr(subprocess, 'run', lambda *args, **kwargs: runs.append(args))
+    monkeypatch.setenv('MICC2_BUILD_LOCK_TIMEOUT', '0.2')
+
+    with FileLock(autobuild.build_lock_path(str(binary))):
+        with pytest.raises(autobuild.BinaryExtensionNotFoundError, match='Timeout'):
+            autobuild.build_missing(str(init), 'foo')
+    assert not runs
+
+
+def test_build_missing_lock_file_error(tmp_path, monkeypatch):
+    init, binary = fake_package(tmp_path)
+    # The lock file cannot be created:
+    monkeypatch.setattr(autobuild, 'build_lock_path', lambda binary: str(tmp_path / 'not-a-dir' / 'foo.lock'))
+    with pytest.raises(autobuild.BinaryExtensionNotFoundError, match='No such file'):
+        autobuild.build_missing(str(init), 'foo')
+    assert list(binary.parent.iterdir()) == [init]
+
+
+def test_build_lock_path(tmp_path):
+    binary = str(tmp_path / 'pkg' / 'foo.so')
+    assert autobuild.build_lock_path(binary) == autobuild.build_lock_path(binary)
+    assert autobuild.build_lock_path(binary) != autobuild.build_lock_path(str(tmp_path / 'pkg' / 'bar.so'))
+    assert not autobuild.build_lock_path(binary).startswith(str(tmp_path))
+
+
+def test_build_lock_timeout(monkeypatch):
+    monkeypatch.delenv('MICC2_BUILD_LOCK_TIMEOUT', raising=False)
+    assert autobuild.build_lock_timeout() == autobuild.BUILD_LOCK_TIMEOUT
+    monkeypatch.setenv('MICC2_BUILD_LOCK_TIMEOUT', '60')
+    assert autobuild.build_lock_timeout() == 60.0
+    monkeypatch.setenv('MICC2_BUILD_LOCK_TIMEOUT', 'one minute')
+    assert autobuild.build_lock_timeout() == autobuild.BUILD_LOCK_TIMEOUT
+
+
+def test_file_lock(tmp_path):
+    lock_file = tmp_path / 'foo.lock'
+    with FileLock(lock_file) as lock:
+        assert lock.is_locked
+        with pytest.raises(FileLockTimeout):
+            FileLock(lock_file, timeout=0.2).acquire()
+    assert not lock.is_locked
+    with FileLock(lock_file, timeout=0.2) as lock:
+        assert lock.is_locked
+
+
+def test_ninja_step_durations(tmp_path):
+    ninja_log = tmp_path / '.ninja_log'
+    ninja_log.write_text(
+        "# ninja log v5\n"
+        "0\t1000\t0\tCMakeFiles/old.dir/old.cpp.o\t1\n"
+    )
+    offset = ninja_log.stat().st_size
+    with ninja_log.open('a') as f:
+        f.write("0\t1500\t0\tCMakeFiles/foo.dir/foo.cpp.o\t2\n")
+        f.write("100\t600\t0\tCMakeFiles/foo.dir/bar.cpp.o\t3\n")
+        f.write("1500\t1750\t0\tfoo.so\t4\n")
+    assert build.ninja_step_durations(ninja_log, offset) == {'compile': 2.0, 'link': 0.25}
+    assert build.ninja_step_durations(ninja_log) == {'compile': 3.0, 'link': 0.25}
+    assert build.ninja_step_durations(tmp_path / 'missing') == {}
+
+
+def test_build_report(tmp_path):
+    binary = tmp_path / 'foo.cpython-39-x86_64-linux-gnu.so'
+    binary.write_bytes(b'0123456789')
+    report = build.extension_report(binary, 'cpp', cache_hit=True)
+    assert report['name'] == 'foo'
+    assert report['status'] == 'up-to-date'
+    assert report['binary_size'] == 10
+    assert build.extension_report(binary, 'cpp')['status'] == 'failed'
+
+    cmake_cache = { 'CMAKE_BUILD_TYPE': 'Release'
+                  , 'CMAKE_CXX_COMPILER': '/usr/bin/c++'
+                  , 'CMAKE_CXX_FLAGS': '-Wall'
+                  , 'CMAKE_CXX_FLAGS_RELEASE': '-O3 -DNDEBUG'
+                  }
+    compiler = build.compiler_settings(cmake_cache, 'CXX')
+    assert compiler['compiler'] == '/usr/bin/c++'
+    assert compiler['flags'] == '-Wall'
+    assert compiler['build_type_flags'] == '-O3 -DNDEBUG'
+
+    path = tmp_path / build.BUILD_REPORT
+    build.write_build_report(path, {'extensions': [report]})
+    assert json.loads(path.read_text())['extensions'][0]['binary_size'] == 10
+    assert list(tmp_path.glob('*.tmp')) == []
+
+
+# ==============================================================================
+# The code below is for debugging a particular test in eclipse/pydev.
+# (normally all tests are run with pytest)
+# ==============================================================================
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_build_cache
+
+    print(f"__main__ running {the_test_you_want_to_debug}")
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        the_test_you_want_to_debug(Path(tmp))
+    print('-*# finished #*-')
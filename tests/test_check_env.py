@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the `micc2 check` command."""
+import json
+from types import SimpleNamespace
+
+from et_micc2.subcmds.check_env import check_env, check_package, check_tool
+
+
+def test_check_package():
+    result = check_package('click', '7.0')
+    assert result['version']
+    assert result['ok']
+    result = check_package('click', '9999.0')
+    assert result['version']
+    assert not result['ok']
+    result = check_package('no-such-package-for-micc2', '1.0')
+    assert not result['version']
+    assert not result['ok']
+
+
+def test_check_tool():
+    result = check_tool('no-such-tool-for-micc2', local=True)
+    assert not result['ok']
+    assert not result['which']
+
+
+def test_check_env_json(capsys):
+    check_env(SimpleNamespace(verbosity=1, json=True))
+    report = json.loads(capsys.readouterr().out)
+    assert report['packages']['click']['ok']
+    assert set(report['tools']) >= {'git', 'cmake', 'make'}
+    assert report['ready']['cli']
+
+
+# ==============================================================================
+# The code below is for debugging a particular test in eclipse/pydev.
+# (normally all tests are run with pytest)
+# ==============================================================================
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_check_package
+
+    print(f"__main__ running {the_test_you_want_to_debug} ...")
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
@@ -1,3 +1,4 @@
+import json
 from pathlib import Path
 
 from et_micc2.tools.components import ComponentDatabase
@@ -36,6 +37,227 @@ def test_components():
         print(f"{key=}")
         assert key == 'foo'
 
+
+def test_component_indexes(tmp_path):
+    keys = ['foo', 'foo2', 'foo/soup', 'foo2/soup2', 'bar/baz']
+    (tmp_path / 'components.json').write_text(json.dumps({key: {'context': {}} for key in keys}))
+    components = ComponentDatabase(tmp_path)
+    assert components.has_name('soup') == 'foo/soup'
+    assert components.has_name('foo/soup2') == 'foo2/soup2'
+    assert components.has_name('soup3') == ''
+    assert components.similar_to('foo') == ['foo', 'foo/soup', 'foo2', 'foo2/soup2']
+    assert components.similar_to('soup2') == ['foo2/soup2']
+    assert components.similar_to('oo') == ['foo', 'foo/soup', 'foo2', 'foo2/soup2']
+    assert components.similar_to('fox') == []
+
+    del components['foo/soup']
+    assert components.has_name('soup') == ''
+    assert components.similar_to('soup') == ['foo2/soup2']
+    components['bar/soup'] = {'context': {}}
+    assert components.has_name('soup') == 'bar/soup'
+    assert components.similar_to('soup') == ['bar/soup', 'foo2/soup2']
+    assert 'foo/soup' not in components and 'bar/soup' in components
+
+
+def test_component_journal(tmp_path, monkeypatch):
+    import et_micc2.tools.components as components_module
+    monkeypatch.setattr(components_module, 'JOURNAL_MAX_ENTRIES', 3)
+
+    def component(name):
+        return {'context': {'add_name': name, 'project_path': tmp_path / name}}
+
+    components = ComponentDatabase(tmp_path)
+    components.serialize(component('foo'))
+    # the first write creates components.json
+    assert json.loads((tmp_path / 'components.json').read_text()) == {
+        'foo': {'context': {'add_name': 'foo', 'project_path': str(tmp_path / 'foo')}}
+    }
+    assert not (tmp_path / 'components.journal').exists()
+
+    components.serialize(component('bar'))
+    del components['foo']
+    components.serialize()
+    assert list(json.loads((tmp_path / 'components.json').read_text())) == ['foo']
+    assert len((tmp_path / 'components.journal').read_text().splitlines()) == 2
+    assert list(ComponentDatabase(tmp_path).db) == ['bar']
+
+    # an interrupted write leaves a truncated last line, which is ignored:
+    with (tmp_path / 'components.journal').open('a') as f:
+        f.write('{"op": "set", "key": "ba')
+    components = ComponentDatabase(tmp_path)
+    assert list(components.db) == ['bar']
+    components.serialize(component('baz'))
+    assert not (tmp_path / 'components.journal').exists()
+    assert list(json.loads((tmp_path / 'components.json').read_text())) == ['bar', 'baz']
+
+    # compaction when the journal grows too long
+    for name in ('a', 'b', 'c'):
+        components.serialize(component(name))
+    assert (tmp_path / 'components.journal').exists()
+    components.serialize(component('d'))
+    assert not (tmp_path / 'components.journal').exists()
+    assert list(ComponentDatabase(tmp_path).db) == ['bar', 'baz', 'a', 'b', 'c', 'd']
+    assert not list(tmp_path.glob('.*.tmp'))
+
+
+def test_component_journal_compacted_before_commit(tmp_path):
+    import shutil
+    import subprocess
+    from types import SimpleNamespace
+    import pytest
+    from et_micc2.tools.project import Project
+    if not shutil.which('git'):
+        pytest.skip('git not available')
+
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=tmp_path, capture_output=True, text=True, check=True).stdout
+
+    git('init', '-q')
+    components = ComponentDatabase(tmp_path)
+    components.serialize({'context': {'add_name': 'foo'}})
+    git('add', 'components.json')
+    components.serialize({'context': {'add_name': 'bar'}})
+    # the journal is not added to the git repository behind the user's back
+    assert (tmp_path / 'components.journal').exists()
+    assert git('ls-files').split() == ['components.json']
+
+    # what micc2 does before committing:
+    infos = []
+    project = SimpleNamespace(
+        context=SimpleNamespace(project_path=tmp_path), logger=SimpleNamespace(info=infos.append), components=components
+    )
+    Project.compact_components(project)
+    assert not (tmp_path / 'components.journal').exists()
+    assert 'components.journal' in infos[0]
+    git('-c', 'user.name=test', '-c', 'user.email=test@test', 'commit', '-q', '-a', '-m', 'add bar')
+    assert list(json.loads(git('show', 'HEAD:components.json'))) == ['foo', 'bar']
+    # nothing to compact
+    Project.compact_components(project)
+    assert len(infos) == 1
+
+
+def test_sqlite_component_database(tmp_path):
+    from et_micc2.tools.components import open_component_database, SQLiteComponentDatabase
+
+    # loaded from components.json, which remains the tracked source of truth
+    keys = ['foo', 'foo2', 'foo/soup', 'foo2/soup2']
+    components_json = tmp_path / 'components.json'
+    components_json.write_text(json.dumps({key: {'context': {'add_name': key}} for key in keys}))
+    assert isinstance(open_component_database(tmp_path), ComponentDatabase)
+    components = open_component_database(tmp_path, 'sqlite')
+    assert isinstance(components, SQLiteComponentDatabase)
+    assert list(json.loads(components_json.read_text())) == keys
+    assert components.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    assert components['foo/soup'] == {'context': {'add_name': 'foo/soup'}}
+    assert 'foo2' in components and 'bar' not in components
+    assert components.has_name('soup') == 'foo/soup'
+    assert components.has_name('foo/soup2') == 'foo2/soup2'
+    assert components.has_name('soup3') == ''
+    assert components.similar_to('foo') == ['foo', 'foo/soup', 'foo2', 'foo2/soup2']
+    assert components.similar_to('oo') == ['foo', 'foo/soup', 'foo2', 'foo2/soup2']
+    assert components.similar_to('soup2') == ['foo2/soup2']
+    assert components.similar_to('fox') == []
+
+    # changes are visible to other connections after serialize
+    del components['foo/soup']
+    components.serialize({'context': {'add_name': 'bar/soup', 'project_path': tmp_path}})
+    # components.json is rewritten with the changes
+    assert list(json.loads(components_json.read_text())) == ['foo', 'foo2', 'foo2/soup2', 'bar/soup']
+    other = open_component_database(tmp_path)
+    assert isinstance(other, SQLiteComponentDatabase)
+    assert other['bar/soup'] == {'context': {'add_name': 'bar/soup', 'project_path': str(tmp_path)}}
+    assert other.has_name('soup') == 'bar/soup'
+    assert other.similar_to('soup') == ['bar/soup', 'foo2/soup2']
+
+    # uncommitted changes are discarded
+    del other['foo']
+    other.close()
+    assert 'foo' in components
+    components.close()
+
+    # components.json modified by e.g. git pull: the database is reloaded
+    components_json.write_text(json.dumps({'baz': {'context': {'add_name': 'baz'}}}))
+    components = open_component_database(tmp_path)
+    assert 'baz' in components and not 'foo' in components
+    assert components.similar_to('ba') == ['baz']
+    components.close()
+
+
+def test_sqlite_component_journal(tmp_path):
+    from et_micc2.tools.components import SQLiteComponentDatabase
+
+    # switching to the sqlite backend with changes in the journal
+    components = ComponentDatabase(tmp_path)
+    components.serialize({'context': {'add_name': 'foo'}})
+    components.serialize({'context': {'add_name': 'bar'}})
+    assert (tmp_path / 'components.journal').exists()
+    components = SQLiteComponentDatabase(tmp_path)
+    assert 'foo' in components and 'bar' in components
+    assert not (tmp_path / 'components.journal').exists()
+    assert list(json.loads((tmp_path / 'components.json').read_text())) == ['foo', 'bar']
+
+    # and back, and forth again
+    components.close()
+    json_components = ComponentDatabase(tmp_path)
+    json_components.serialize({'context': {'add_name': 'baz'}})
+    components = SQLiteComponentDatabase(tmp_path)
+    assert 'baz' in components
+    components.close()
+
+
+def test_sqlite_failed_migration(tmp_path):
+    from et_micc2.tools.components import SQLiteComponentDatabase
+    import pytest
+
+    (tmp_path / 'components.json').write_text('{"foo": {"context": {}}, "bar":')
+    with pytest.raises(json.JSONDecodeError):
+        SQLiteComponentDatabase(tmp_path)
+    # nothing changed, the migration is retried next time
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['components.json']
+
+    (tmp_path / 'components.json').write_text('{"foo": {"context": {}}, "bar": {"context": {}}}')
+    components = SQLiteComponentDatabase(tmp_path)
+    assert 'foo' in components and 'bar' in components
+    assert components.similar_to('bar') == ['bar']
+    components.close()
+
+
+def test_sqlite_fts_support_changes(tmp_path, monkeypatch):
+    import et_micc2.tools.components as components_module
+    from et_micc2.tools.components import SQLiteComponentDatabase
+
+    # A database created by a SQLite without fts5/trigram support:
+    monkeypatch.setattr(components_module, 'fts_available', lambda: False)
+    components = SQLiteComponentDatabase(tmp_path)
+    assert not components.fts
+    components.serialize({'context': {'add_name': 'foo/soup'}})
+    assert components.similar_to('soup') == ['foo/soup']
+    components.close()
+
+    # opened by a SQLite with support: the full text search table is filled
+    monkeypatch.setattr(components_module, 'fts_available', lambda: True)
+    components = SQLiteComponentDatabase(tmp_path)
+    assert components.fts
+    assert components.similar_to('soup') == ['foo/soup']
+    components.serialize({'context': {'add_name': 'bar/soup'}})
+    components.close()
+
+    # and again by a SQLite without support: the triggers would make inserts fail
+    monkeypatch.setattr(components_module, 'fts_available', lambda: False)
+    components = SQLiteComponentDatabase(tmp_path)
+    del components['bar/soup']
+    components.serialize({'context': {'add_name': 'baz/soup'}})
+    assert components.similar_to('soup') == ['baz/soup', 'foo/soup']
+    components.close()
+
+    # the full text search table, which is outdated now, is rebuilt
+    monkeypatch.setattr(components_module, 'fts_available', lambda: True)
+    components = SQLiteComponentDatabase(tmp_path)
+    assert components.similar_to('soup') == ['baz/soup', 'foo/soup']
+    components.close()
+
+
 if __name__ == "__main__":
     the_test_you_want_to_debug = test_components
 
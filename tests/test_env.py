@@ -1,5 +1,7 @@
 from pathlib import Path
+import sys
 
+import et_micc2.tools.env as env
 from et_micc2.tools.env import common_path
 from et_micc2.tools.utils import in_directory
 
@@ -29,6 +31,49 @@ def test_common_path_2():
         expected = Path('et_micc2/').resolve()
         assert result == expected
 
+def test_probes_are_memoized():
+    """"""
+    env.clear_caches()
+    python = Path(sys.executable).name
+    toolinfo = env.ToolInfo(python)
+    assert toolinfo.is_available()
+    version = toolinfo.version()
+    assert version.startswith('Python')
+    assert toolinfo.version() == version # ToolInfo.version used to overwrite itself
+    env.ToolInfo(python).version()
+    assert env.which.cache_info().misses == 1
+    assert env.tool_version.cache_info().misses == 1
+
+def test_probe_tools():
+    """"""
+    env.clear_caches()
+    python = Path(sys.executable).name
+    toolinfos = env.probe_tools([python, 'no-such-tool-for-micc2'])
+    assert toolinfos[python].is_available()
+    assert not toolinfos['no-such-tool-for-micc2'].is_available()
+    assert env.tool_version.cache_info().currsize == 1
+    env.ToolInfo(python).version()
+    assert env.tool_version.cache_info().misses == 1
+
+def test_pkginfo():
+    """"""
+    env.clear_caches()
+    pkginfo = env.PkgInfo('click')
+    assert pkginfo.is_available()
+    assert pkginfo.version() == env.importlib_metadata.version('click')
+    assert Path(pkginfo.which).is_dir()
+    env.PkgInfo('click')
+    assert env.get_distribution.cache_info().misses == 1
+    assert not env.PkgInfo('no-such-package-for-micc2').is_available()
+
+def test_mock_bypasses_memoization():
+    """"""
+    env.ToolInfo.mock = ['cmake']
+    try:
+        assert not env.ToolInfo('cmake').is_available()
+    finally:
+        env.ToolInfo.mock = []
+
 if __name__ == "__main__":
     the_test_you_want_to_debug = test_common_path_1
 
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 """Tests for messages module."""
 
+import json
 from pathlib import Path
+import time
 import types
 
 import et_micc2.tools.env as env
@@ -44,12 +46,47 @@ import et_micc2.tools.messages as messages
 #     assert "done." in logtext
     
 
+def test_log_spans(tmp_path):
+    logger = messages.create_logger(tmp_path / 'micc.log', console=False)
+    context = types.SimpleNamespace(logger=logger, timing_json=tmp_path / 'spans.jsonl')
+    with messages.logtime(context):
+        with messages.log(logger.info, 'outer'):
+            with messages.log(logger.info, 'fast'):
+                pass
+            with messages.log(logger.info, 'slow'):
+                time.sleep(0.02)
+    outer = logger.spans[0]
+    assert outer.name == 'outer'
+    assert [span.name for span in outer.children] == ['fast', 'slow']
+    assert outer.duration >= outer.children[1].duration >= 0.02
+
+    summary = logger.span_summary().split('\n')
+    assert [line.split()[-1] for line in summary] == ['outer', 'slow', 'fast']
+
+    records = [json.loads(line) for line in context.timing_json.read_text().splitlines()]
+    assert [record['path'] for record in records] == ['outer', 'outer/slow', 'outer/fast']
+    assert records[1]['depth'] == 1
+
+
+def test_log_spans_exception():
+    logger = messages.create_logger('', console=False)
+    try:
+        with messages.log(logger.info, 'failing'):
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    with messages.log(logger.info, 'next'):
+        pass
+    assert [span.name for span in logger.spans] == ['failing', 'next']
+    assert logger._indent == ''
+
+
 # ==============================================================================
 # The code below is for debugging a particular test in eclipse/pydev.
 # (normally all tests are run with pytest)
 # ==============================================================================
 if __name__ == "__main__":
-    the_test_you_want_to_debug = test_log
+    the_test_you_want_to_debug = test_log_spans_exception
 
     print(f"__main__ running {the_test_you_want_to_debug}")
     the_test_you_want_to_debug()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for et_micc2.tools.profiling."""
+import pstats
+import subprocess
+import sys
+import time
+
+import et_micc2.tools.profiling as profiling
+
+
+def test_phase_disabled():
+    profiling.timings.clear()
+    with profiling.phase('config load'):
+        pass
+    assert not profiling.timings
+
+
+def test_profiler(tmp_path):
+    output = tmp_path / 'micc2.pstats'
+    profiler = profiling.Profiler(output)
+    profiler.start()
+    try:
+        with profiling.phase('config load'):
+            with profiling.phase('TOML parse'):
+                time.sleep(0.01)
+        subprocess.run([sys.executable, '--version'], capture_output=True)
+        subprocess.run(['git', '--version'], capture_output=True)
+    finally:
+        profiler.stop()
+    assert profiling.timings['config load'][0] >= profiling.timings['TOML parse'][0] >= 0.01
+    assert profiling.timings['subprocess'][1] == 1
+    assert profiling.timings['git'][1] == 1
+    assert not hasattr(subprocess.run, '__wrapped_subprocess__')
+    report = profiler.report()
+    assert report.split('\n')[2].split()[0] == 'config' # slowest first
+    assert pstats.Stats(str(output)).total_calls > 0
+
+
+def test_collapsed_stacks(tmp_path):
+    output = tmp_path / 'micc2.folded'
+    profiler = profiling.Profiler(output)
+    profiler.start()
+    start = time.perf_counter()
+    while time.perf_counter() - start < 0.1:
+        sum(range(1000))
+    profiler.stop()
+    lines = output.read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert 'test_collapsed_stacks' in stack
+    assert int(count) > 0
+
+
+# ==============================================================================
+# The code below is for debugging a particular test in eclipse/pydev.
+# (normally all tests are run with pytest)
+# ==============================================================================
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_phase_disabled
+
+    print(f"__main__ running {the_test_you_want_to_debug} ...")
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
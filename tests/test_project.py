@@ -5,6 +5,8 @@
 from pathlib import Path
 from types import SimpleNamespace
 
+import pytest
+
 import et_micc2.tools.env as env
 import et_micc2.tools.project as project
 
@@ -20,6 +22,43 @@ def test_ctor():
     print(proj.pyproject_toml['tool']['poetry']['dependencies'])
 
 
+def test_components_loaded_lazily(tmp_path):
+    options = SimpleNamespace(
+        project_path=Path.cwd(),
+        verbosity=1,
+        clear_log=False,
+    )
+    proj = project.Project(options)
+    assert proj._components is None
+    options.project_path = tmp_path
+    assert proj.components is proj.components
+    assert not proj.components.has_name('foo')
+
+
+def test_get_project_path(tmp_path, monkeypatch):
+    project_path = tmp_path / 'FOO'
+    deep = project_path / 'foo' / 'bar' / 'baz'
+    deep.mkdir(parents=True)
+    (project_path / 'pyproject.toml').write_text('[tool.poetry]\nname = "FOO"\n')
+    parsed = []
+    monkeypatch.setattr(project, 'TomlFile', lambda path: parsed.append(path))
+
+    with pytest.raises(RuntimeError):
+        # no package foo/__init__.py
+        project.get_project_path(deep)
+    assert len(parsed) == 1
+
+    (project_path / 'foo' / '__init__.py').write_text('')
+    assert project.get_project_path(deep) == project_path
+    # only the directory with a pyproject.toml file is parsed
+    assert parsed == [project_path / 'pyproject.toml'] * 2
+
+    (project_path / 'pyproject.toml').unlink()
+    with pytest.raises(RuntimeError):
+        project.get_project_path(deep)
+    assert len(parsed) == 2
+
+
 def test_existing_tool():
     ti = env.ToolInfo('gh')
     assert ti.is_available()
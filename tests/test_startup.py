@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""Startup time benchmark for the micc2 CLI.
+
+Importing et_micc2.cli_micc must not import the subcommand modules or the heavy
+dependencies: they are imported by the subcommands that need them.
+"""
+import subprocess
+import sys
+import time
+
+heavy_modules = ( 'pkg_resources', 'pypi_simple', 'requests', 'tomlkit', 'semantic_version'
+                , 'et_micc2.subcmds', 'et_micc2.tools.project'
+                )
+
+
+def test_lazy_imports():
+    code = ( "import sys, et_micc2.cli_micc\n"
+             "print('\\n'.join(sys.modules))"
+           )
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    imported = completed.stdout.split()
+    for module in heavy_modules:
+        assert not any(m == module or m.startswith(module + '.') for m in imported), module
+
+
+def test_startup_time():
+    """The time for `micc2 --help`, the best of 3 runs, stays well below that of importing everything."""
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'et_micc2.cli_micc', '--help'], capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    print(f"micc2 --help: {min(timings):.3f}s")
+    assert min(timings) < 2.0
+
+
+# ==============================================================================
+# The code below is for debugging a particular test in eclipse/pydev.
+# (normally all tests are run with pytest)
+# ==============================================================================
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_startup_time
+
+    print(f"__main__ running {the_test_you_want_to_debug} ...")
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
@@ -18,6 +18,17 @@ def test_expand_string():
     assert s == 'This is expanded_bar and this is expanded_foo.\nAnd this is expanded_foobar.'
 
 
+def test_template():
+    t = tmpl.Template("{{tmpl.foo}} and {{tmpl.bar}}, {{tmpl.foo}} again.")
+    assert t.names == ['foo', 'bar', 'foo']
+    assert t.expand({'foo': 1, 'bar': 'two'}) == "1 and two, 1 again."
+    with pytest.raises(ValueError, match="'bar'"):
+        t.expand({'foo': 1})
+    # parameter values are not expanded themselves:
+    assert t.expand({'foo': '{{tmpl.bar}}', 'bar': 'two'}) == "{{tmpl.bar}} and two, {{tmpl.bar}} again."
+    assert tmpl.Template("no parameters {{ tmpl.foo }}").expand({}) == "no parameters {{ tmpl.foo }}"
+
+
 def test_expand_file():
     root = Path('./tests')
     path_to_template = root / 'template_file_{{tmpl.fname}}'
@@ -73,6 +84,149 @@ def test_expand_folder():
     assert (destination / 'template_folder_expanded_dname/template_subfolder_expanded_dnamesub/sub_template_file_expanded_fname').read_text() == expected
 
 
+def test_compile_folder(tmp_path):
+    template_folder = tmp_path / 'template'
+    (template_folder / 'sub').mkdir(parents=True)
+    (template_folder / 'sub' / '{{tmpl.fname}}.txt').write_text('{{tmpl.foo}}')
+    (template_folder / 'data.bin').write_bytes(b'\0\1{{tmpl.foo}}\xff')
+
+    compiled = tmpl.compile_folder(template_folder)
+    assert tmpl.compile_folder(template_folder) is compiled
+    assert {f.path.name: f.binary for f in compiled.files} == {'{{tmpl.fname}}.txt': False, 'data.bin': True}
+
+    destination = tmp_path / 'expanded'
+    tmpl.expand_folder(template_folder, destination, {'fname': 'file', 'foo': 'bar'})
+    assert (destination / 'sub' / 'file.txt').read_text() == 'bar'
+    assert (destination / 'data.bin').read_bytes() == b'\0\1{{tmpl.foo}}\xff'
+
+    # adding a file invalidates the compiled folder
+    (template_folder / 'sub' / 'new.txt').write_text('new')
+    assert not compiled.is_up_to_date()
+    recompiled = tmpl.compile_folder(template_folder)
+    assert recompiled is not compiled
+    assert len(recompiled.files) == 3
+
+
+def test_expand_folder_parallel(tmp_path):
+    template_folder = tmp_path / 'template'
+    for i in range(50):
+        d = template_folder / f'd{i%5}' / '{{tmpl.dname}}'
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f'f{i}.txt').write_text(f'{i} {{{{tmpl.foo}}}}')
+    (template_folder / 'd3' / 'missing.txt').write_text('{{tmpl.missing}}')
+
+    destination = tmp_path / 'expanded'
+    with pytest.raises(ValueError, match="Missing parameter: 'missing'"):
+        tmpl.expand_folder(template_folder, destination, {'dname': 'x', 'foo': 'bar'}, max_workers=4)
+
+    (template_folder / 'd3' / 'missing.txt').unlink()
+    tmpl.expand_folder(template_folder, destination, {'dname': 'x', 'foo': 'bar'}, max_workers=4)
+    for i in range(50):
+        assert (destination / f'd{i%5}' / 'x' / f'f{i}.txt').read_text() == f'{i} bar'
+
+
+def test_binary_and_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(tmpl, 'LARGE_FILE', 100)
+    template_folder = tmp_path / 'template'
+    template_folder.mkdir()
+    (template_folder / 'small.txt').write_text('{{tmpl.foo}}\r\n')
+    (template_folder / 'plain.txt').write_text('no parameters')
+    (template_folder / 'large.txt').write_text('line {{tmpl.foo}}\n' * 100)
+    (template_folder / 'large.bin').write_bytes(bytes(range(256)) * 10)
+
+    compiled = tmpl.TemplateFolder(template_folder)
+    files = {f.path.name: f for f in compiled.files}
+    assert not files['small.txt'].streamed and not files['small.txt'].is_copied
+    assert files['plain.txt'].is_copied
+    assert files['large.txt'].streamed and not files['large.txt'].binary
+    assert files['large.bin'].streamed and files['large.bin'].binary
+    assert files['large.txt'].contents is None
+
+    with pytest.raises(ValueError, match="Missing parameter: 'foo'"):
+        files['large.txt'].validate_contents({})
+
+    destination = tmp_path / 'expanded'
+    compiled.expand(destination, {'foo': 'bar'}, hardlink=True)
+    assert (destination / 'small.txt').read_bytes() == b'bar\r\n'
+    assert (destination / 'large.txt').read_text() == 'line bar\n' * 100
+    assert (destination / 'large.bin').read_bytes() == bytes(range(256)) * 10
+    assert (destination / 'large.bin').samefile(template_folder / 'large.bin')
+    assert (destination / 'plain.txt').samefile(template_folder / 'plain.txt')
+    assert not (destination / 'small.txt').samefile(template_folder / 'small.txt')
+
+
+def test_large_file_not_utf8(tmp_path, monkeypatch):
+    monkeypatch.setattr(tmpl, 'LARGE_FILE', 100)
+    template_folder = tmp_path / 'template'
+    template_folder.mkdir()
+    # text in the sample used for classification, but not utf-8 further on:
+    data = b'a' * 20000 + b'\xff\xfe{{tmpl.foo}}'
+    (template_folder / 'data.dat').write_bytes(data)
+    (template_folder / 'small.txt').write_text('{{tmpl.foo}}')
+
+    destination = tmp_path / 'expanded'
+    tmpl.expand_folder(template_folder, destination, {'foo': 'bar'})
+    assert (destination / 'data.dat').read_bytes() == data
+    assert (destination / 'small.txt').read_text() == 'bar'
+
+    plan = tmpl.Plan()
+    plan.add_folder(template_folder, tmp_path / 'planned', {'foo': 'bar'})
+    plan.commit()
+    assert (tmp_path / 'planned' / 'data.dat').read_bytes() == data
+
+
+def test_plan(tmp_path):
+    template_folder = tmp_path / 'template'
+    template_folder.mkdir()
+    (template_folder / 'a.txt').write_text('{{tmpl.foo}}')
+    (template_folder / 'b.txt').write_text('{{tmpl.bar}}')
+    destination = tmp_path / 'expanded'
+
+    plan = tmpl.Plan()
+    with pytest.raises(ValueError, match="Missing parameter: 'bar'"):
+        plan.add_folder(template_folder, destination, {'foo': 'x'})
+    assert not plan.files
+    assert not destination.exists()
+
+    plan.add_folder(template_folder, destination, {'foo': 'x', 'bar': 'yz'})
+    assert plan.n_bytes == 3
+    assert not destination.exists()
+    assert [plan.status(f) for f in plan.files] == ['new', 'new']
+    assert plan.report().startswith('2 files, 3 bytes')
+
+    plan.commit()
+    assert (destination / 'a.txt').read_text() == 'x'
+    assert (destination / 'b.txt').read_text() == 'yz'
+    assert [plan.status(f) for f in plan.files] == ['unchanged', 'unchanged']
+
+
+def test_expand_templates_dry_run(tmp_path, capsys):
+    from types import SimpleNamespace
+    import et_micc2.tools.expand as expand
+
+    options = SimpleNamespace( templates=['submodule-py', 'submodule-py-test']
+                             , project_path=tmp_path / 'FOO'
+                             , package_name='foo'
+                             , module_location_relative=Path('.')
+                             , template_parameters=SimpleNamespace(data={'module_name': 'bar'})
+                             , dry_run=True
+                             )
+    msg = expand.expand_templates(options)
+    assert msg.startswith("Missing parameter")
+    assert not options.project_path.exists()
+
+    options.template_parameters.data.update(
+        {'package_name': 'foo', 'import_lib': 'foo.bar', 'project_name': 'FOO', 'source_dir': 'foo/bar', 'test_': 'test_'}
+    )
+    assert expand.expand_templates(options) is None
+    assert 'Dry run, nothing written' in capsys.readouterr().out
+    assert not options.project_path.exists()
+
+    options.dry_run = False
+    assert expand.expand_templates(options) is None
+    assert (options.project_path / 'foo' / 'bar' / '__init__.py').is_file()
+
+
 # ==============================================================================
 # The code below is for debugging a particular test in eclipse/pydev.
 # (otherwise all tests are normally run with pytest)
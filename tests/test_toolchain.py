@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for et_micc2.tools.toolchain."""
+import json
+
+import et_micc2.tools.toolchain as toolchain
+
+
+def test_get_toolchain(tmp_path, monkeypatch):
+    monkeypatch.setattr(toolchain, 'CACHE_DIR', tmp_path)
+    toolchain.get_toolchain.cache_clear()
+    result = toolchain.get_toolchain()
+    assert result['ext_suffix']
+    assert set(result['compilers']) == {'CC', 'CXX', 'FC'}
+    assert toolchain.cache_file().parent == tmp_path
+    assert toolchain.cache_file().is_file()
+
+    # Read from the cache file, rather than discovered:
+    cached = json.loads(toolchain.cache_file().read_text())
+    cached['toolchain']['ext_suffix'] = '.from-cache.so'
+    toolchain.cache_file().write_text(json.dumps(cached))
+    toolchain.get_toolchain.cache_clear()
+    assert toolchain.get_toolchain()['ext_suffix'] == '.from-cache.so'
+
+    # A modified interpreter invalidates the cache
+    cached['stamp']['version'] = 'another python'
+    toolchain.cache_file().write_text(json.dumps(cached))
+    toolchain.get_toolchain.cache_clear()
+    assert toolchain.get_toolchain()['ext_suffix'] == result['ext_suffix']
+
+    # So does a modified environment (e.g. after `module load ...`)
+    cached = json.loads(toolchain.cache_file().read_text())
+    cached['toolchain']['ext_suffix'] = '.from-cache.so'
+    toolchain.cache_file().write_text(json.dumps(cached))
+    toolchain.get_toolchain.cache_clear()
+    assert toolchain.get_toolchain()['ext_suffix'] == '.from-cache.so'
+    monkeypatch.setenv('CXX', 'another-c++')
+    toolchain.get_toolchain.cache_clear()
+    result = toolchain.get_toolchain()
+    assert result['ext_suffix'] != '.from-cache.so'
+    assert result['compilers']['CXX']['exe'] == 'another-c++'
+    toolchain.get_toolchain.cache_clear()
+
+
+# ==============================================================================
+# The code below is for debugging a particular test in eclipse/pydev.
+# (normally all tests are run with pytest)
+# ==============================================================================
+if __name__ == "__main__":
+    print('Run these tests with pytest, they require the tmp_path and monkeypatch fixtures.')
@@ -126,6 +126,25 @@ def test_in_directory():
         assert Path.cwd() == p0
 
 
+def test_atomic_replace(tmp_path):
+    import pytest
+    path = tmp_path / 'foo.json'
+    path.write_text('old')
+    with utils.atomic_replace(path) as tmp:
+        assert tmp.parent == tmp_path and tmp != path
+        tmp.write_text('new')
+        assert path.read_text() == 'old'
+    assert path.read_text() == 'new'
+    assert [p.name for p in tmp_path.iterdir()] == ['foo.json']
+
+    # a failing write leaves the file untouched, and the temporary file removed
+    with pytest.raises(RuntimeError):
+        with utils.atomic_replace(path) as tmp:
+            tmp.write_text('partial')
+            raise RuntimeError('write failed')
+    assert path.read_text() == 'new'
+    assert [p.name for p in tmp_path.iterdir()] == ['foo.json']
+
 
 # ==============================================================================
 # The code below is for debugging a particular test in eclipse/pydev.